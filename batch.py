@@ -0,0 +1,386 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Callable, Tuple
+from terraform_utils import create_terraform_config, create_terraform_import_script, resolve_provider_versions
+from rate_limiter import RateLimitScheduler
+from handler_registry import get_service
+from metrics import METRICS, REPORT_FILE, export_metrics
+from snapshots import find_snapshots, iter_snapshot, snapshot_file, write_snapshot
+
+DEFAULT_WORKERS = 8
+DEFAULT_CREATED_SLICES = 8
+DEFAULT_OKTA_TYPES = list(get_service('okta').resource_types)
+DEFAULT_GCP_TYPES = list(get_service('gcp').resource_types)
+
+EXAMPLE_CONFIG = """{
+  "output_dir": "imports",
+  "max_workers": 8,
+  "okta": [
+    {"org_name": "acme", "base_url": "okta.com", "api_token_env": "ACME_OKTA_TOKEN",
+     "resource_types": ["users", "groups"], "partitioned": true,
+     "created_slices": {"start": "2015-01-01", "end": "2025-01-01", "count": 10}}
+  ],
+  "gcp": [
+    {"project_id": "acme-prod", "zone": "europe-west2-a", "credentials": "/secrets/acme-prod.json",
+     "resource_types": ["instances", "buckets"]},
+    {"project_id": "acme-shared", "credentials": "/secrets/acme-shared.json", "asset_inventory": true,
+     "scope": "folders/123456789012", "resource_types": ["instances", "networks", "service_accounts"]}
+  ]
+}"""
+
+
+def load_batch_config(path: str) -> Dict:
+    """Load a batch configuration file (JSON)."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def config_from_args(args: argparse.Namespace) -> Dict:
+    """Build a batch configuration from a config file and/or command line flags."""
+    config = load_batch_config(args.config) if args.config else {}
+    config.setdefault('okta', [])
+    config.setdefault('gcp', [])
+
+    for org_name in args.okta_org or []:
+        config['okta'].append({
+            'org_name': org_name,
+            'base_url': args.okta_base_url,
+            'api_token_env': args.okta_token_env,
+            'resource_types': args.okta_types,
+            'partitioned': args.partitioned,
+        })
+    for project_id in args.gcp_project or []:
+        config['gcp'].append({
+            'project_id': project_id,
+            'zone': args.gcp_zone,
+            'credentials': args.gcp_credentials,
+            'resource_types': args.gcp_types,
+            'asset_inventory': args.gcp_asset_inventory,
+        })
+    if args.output_dir:
+        config['output_dir'] = args.output_dir
+    if args.workers:
+        config['max_workers'] = args.workers
+    if args.prometheus_textfile:
+        config['prometheus_textfile'] = args.prometheus_textfile
+    if args.replay:
+        config['replay'] = True
+    if args.plan:
+        config['plan'] = True
+    if args.check:
+        config['check'] = True
+    if args.max_plan_errors:
+        config['max_plan_errors'] = args.max_plan_errors
+    return config
+
+
+def okta_tenant_dir(output_dir: str, tenant: Dict) -> str:
+    return os.path.join(output_dir, f"okta_{tenant['org_name']}")
+
+
+def gcp_project_dir(output_dir: str, project: Dict) -> str:
+    return os.path.join(output_dir, f"gcp_{project['project_id']}")
+
+
+def prepare_okta_tenant(tenant: Dict, output_dir: str) -> Dict:
+    """Write the provider config for an Okta tenant and resolve its API token."""
+    token_env = tenant.get('api_token_env', 'OKTA_API_TOKEN')
+    api_key = os.environ.get(token_env)
+    if not api_key:
+        raise ValueError(f"Okta org {tenant['org_name']}: environment variable {token_env} is not set")
+
+    tenant_dir = okta_tenant_dir(output_dir, tenant)
+    os.makedirs(tenant_dir, exist_ok=True)
+    create_terraform_config(
+        provider="okta",
+        output_dir=tenant_dir,
+        api_key=api_key,
+        base_url=tenant.get('base_url', 'okta.com'),
+        org_name=tenant['org_name'],
+    )
+    return {'api_key': api_key, 'dir': tenant_dir, 'scheduler': RateLimitScheduler()}
+
+
+def prepare_gcp_project(project: Dict, output_dir: str) -> Dict:
+    """Write the provider config for a GCP project."""
+    project_dir = gcp_project_dir(output_dir, project)
+    os.makedirs(project_dir, exist_ok=True)
+    create_terraform_config(
+        provider="gcp",
+        output_dir=project_dir,
+        project_id=project['project_id'],
+        zone=project.get('zone', 'europe-west2-a'),
+        creds=project.get('credentials', ''),
+    )
+    return {'dir': project_dir}
+
+
+def okta_partitions(tenant: Dict) -> Optional[Dict[str, List[Dict]]]:
+    """Return the crawl slices of a tenant with "created_slices", which splits users by created date.
+
+    "end" defaults to today.  Other types keep their default slices if the
+    tenant is "partitioned", and are not split otherwise.
+    """
+    slices = tenant.get('created_slices')
+    if not slices:
+        return None
+    from okta_crawler import OKTA_PARTITIONS, date_range_partitions
+
+    partitions = dict(OKTA_PARTITIONS) if tenant.get('partitioned') else {}
+    partitions['users'] = date_range_partitions(slices['start'], slices.get('end') or date.today().isoformat(),
+                                                slices.get('count', DEFAULT_CREATED_SLICES))
+    return partitions
+
+
+def run_okta_collector(tenant: Dict, context: Dict, resource_types: List[str]) -> Optional[str]:
+    """Stream Okta resource types that are crawled together into their snapshots and import files."""
+    from okta_handler import stream_okta_import
+
+    # One scheduler per tenant: every resource type of an org shares its rate-limit budget.
+    import_files = stream_okta_import(tenant['org_name'], context['api_key'], tenant.get('base_url', 'okta.com'),
+                                      resource_types, partitioned=tenant.get('partitioned', False),
+                                      scheduler=context['scheduler'], output_dir=context['dir'],
+                                      partitions=okta_partitions(tenant))
+    return ", ".join(import_file for import_file in import_files.values() if import_file) or None
+
+
+def write_gcp_output(context: Dict, resource_type: str, resources: List) -> Optional[str]:
+    """Write one GCP resource type's snapshot and import file.
+
+    Only called with a complete fetch: the fetch functions raise on failure,
+    so the job is recorded as failed and the previous snapshot is kept.
+    """
+    write_snapshot(snapshot_file('gcp', resource_type, context['dir']), resource_type, resources)
+    if not resources:
+        return None
+    return create_terraform_import_script(resources, resource_type, verbose=False, output_dir=context['dir'])
+
+
+def run_gcp_collector(project: Dict, context: Dict, resource_type: str) -> Optional[str]:
+    """Fetch one GCP resource type and write its snapshot and import file."""
+    from gcp_handler import get_gcp_resources
+
+    # Instances are listed across every zone unless the project pins "instance_zone".
+    resources = get_gcp_resources(project['project_id'], resource_type, project.get('instance_zone'),
+                                  project.get('credentials'))
+    return write_gcp_output(context, resource_type, resources)
+
+
+def run_gcp_asset_collector(project: Dict, context: Dict, resource_types: List[str]) -> Optional[str]:
+    """Fetch several GCP resource types with one Cloud Asset search and write their snapshots and import files."""
+    from gcp_handler import search_gcp_assets
+
+    # "scope" widens the search to a folder or organization; the project only holds the provider config.
+    discovered = search_gcp_assets(project.get('scope') or project['project_id'], resource_types,
+                                   project.get('credentials'))
+    import_files = [write_gcp_output(context, resource_type, resources) for resource_type, resources in discovered.items()]
+    return ", ".join(import_file for import_file in import_files if import_file) or None
+
+
+def output_dirs(config: Dict) -> List[str]:
+    """Return the output directory of every configured tenant and project."""
+    output_dir = config.get('output_dir', '.')
+    return ([okta_tenant_dir(output_dir, tenant) for tenant in config.get('okta', [])] +
+            [gcp_project_dir(output_dir, project) for project in config.get('gcp', [])])
+
+
+def replay_dirs(config: Dict) -> List[str]:
+    """Return the directories to replay: the configured ones, or every directory under output_dir with snapshots."""
+    directories = output_dirs(config)
+    output_dir = config.get('output_dir', '.')
+    if not directories and os.path.isdir(output_dir):
+        directories = [output_dir] + sorted(os.path.join(output_dir, name) for name in os.listdir(output_dir)
+                                            if os.path.isdir(os.path.join(output_dir, name)))
+    return [directory for directory in directories if os.path.isdir(directory) and find_snapshots(directory)]
+
+
+def replay_snapshot(path: str, resource_type: str, directory: str) -> Optional[str]:
+    """Regenerate one resource type's import file from its snapshot, without calling any API."""
+    return create_terraform_import_script(iter_snapshot(path), resource_type, verbose=False, output_dir=directory)
+
+
+def build_replay_jobs(config: Dict) -> List[Tuple[str, Callable[[], Optional[str]]]]:
+    """One job per snapshot found in the replayed directories."""
+    jobs = []
+    for directory in replay_dirs(config):
+        for _, resource_type, path in find_snapshots(directory):
+            jobs.append((f"replay:{os.path.basename(os.path.abspath(directory))}:{resource_type}",
+                         lambda p=path, r=resource_type, d=directory: replay_snapshot(p, r, d)))
+    return jobs
+
+
+def failed_job(error: Exception) -> Callable[[], Optional[str]]:
+    """A job that raises a setup error, so run_jobs records it like any failed collector."""
+    def fail() -> Optional[str]:
+        raise error
+    return fail
+
+
+def build_jobs(config: Dict) -> List[Tuple[str, Callable[[], Optional[str]]]]:
+    """Expand a batch configuration into independent (label, collector) jobs.
+
+    A tenant or project that cannot be set up (e.g. its token variable is
+    unset) becomes a single failed job, and the others still run.
+    """
+    output_dir = config.get('output_dir', '.')
+    jobs = []
+
+    for tenant in config.get('okta', []):
+        from okta_crawler import okta_crawl_units
+
+        try:
+            context = prepare_okta_tenant(tenant, output_dir)
+        except Exception as e:
+            jobs.append((f"okta:{tenant['org_name']}:setup", failed_job(e)))
+            continue
+        # Dependent types (e.g. group_memberships) run in their parent's job, so each collection is listed once.
+        for unit in okta_crawl_units(tenant.get('resource_types') or DEFAULT_OKTA_TYPES):
+            jobs.append((f"okta:{tenant['org_name']}:{'+'.join(unit)}",
+                         lambda t=tenant, c=context, u=unit: run_okta_collector(t, c, u)))
+
+    for project in config.get('gcp', []):
+        from gcp_handler import GCP_RESOURCE_TYPES
+
+        try:
+            context = prepare_gcp_project(project, output_dir)
+        except Exception as e:
+            jobs.append((f"gcp:{project['project_id']}:setup", failed_job(e)))
+            continue
+        resource_types = project.get('resource_types') or DEFAULT_GCP_TYPES
+        # Types with no list call of their own (or every type, with "asset_inventory") share one asset search.
+        use_asset_inventory = project.get('asset_inventory') or project.get('scope')
+        searched = [resource_type for resource_type in resource_types
+                    if use_asset_inventory or resource_type not in GCP_RESOURCE_TYPES]
+        if searched:
+            jobs.append((f"gcp:{project['project_id']}:assets",
+                         lambda p=project, c=context, r=searched: run_gcp_asset_collector(p, c, r)))
+        for resource_type in resource_types:
+            if resource_type not in searched:
+                jobs.append((f"gcp:{project['project_id']}:{resource_type}",
+                             lambda p=project, c=context, r=resource_type: run_gcp_collector(p, c, r)))
+
+    return jobs
+
+
+def run_batch(config: Dict) -> Dict[str, Dict]:
+    """Run every collector in the configuration concurrently.  Returns a result per job."""
+    # Resolve provider versions once, up front, instead of once per tenant.
+    resolve_provider_versions(["google", "okta"])
+    return run_jobs(build_jobs(config), config.get('max_workers', DEFAULT_WORKERS))
+
+
+def run_jobs(jobs: List[Tuple[str, Callable[[], Optional[str]]]], max_workers: int = DEFAULT_WORKERS) -> Dict[str, Dict]:
+    """Run (label, collector) jobs concurrently.  Returns a result per job."""
+    results = {}
+
+    def timed(collector: Callable[[], Optional[str]]) -> Dict:
+        started = time.monotonic()
+        import_file = collector()
+        return {'import_file': import_file, 'seconds': round(time.monotonic() - started, 2)}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(timed, collector): label for label, collector in jobs}
+        for future in as_completed(futures):
+            label = futures[future]
+            try:
+                results[label] = future.result()
+                print(f"[done] {label}: {results[label]['import_file']} ({results[label]['seconds']}s)")
+            except Exception as e:
+                results[label] = {'error': str(e)}
+                print(f"[failed] {label}: {e}")
+    return results
+
+
+def plan_dirs(directories: List[str], check: bool = False, max_errors: Optional[int] = None) -> bool:
+    """Initialise and run the sharded plan in each directory, then optionally a checking plan.
+
+    Each plan stops early once it has reported `max_errors` errors.
+
+    Returns True if every plan succeeded.
+    """
+    from terraform_plan import check_plan, run_sharded_plan
+    from utils import check_terraform_init
+
+    succeeded = True
+    for directory in directories:
+        print(f"\nPlanning {directory}...")
+        if not (check_terraform_init(directory) and run_sharded_plan(work_dir=directory, max_errors=max_errors)):
+            succeeded = False
+        elif check and not check_plan(directory, max_errors):
+            succeeded = False
+    return succeeded
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run the resource importer without prompts, collecting every service concurrently.",
+        epilog=f"Example config file:\n{EXAMPLE_CONFIG}",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--config', help="JSON batch configuration file")
+    parser.add_argument('--output-dir', help="Directory for generated files (one sub-directory per tenant/project)")
+    parser.add_argument('--workers', type=int, help=f"Collectors to run at once (default: {DEFAULT_WORKERS})")
+    parser.add_argument('--okta-org', action='append', help="Okta org name (repeatable)")
+    parser.add_argument('--okta-base-url', default='okta.com')
+    parser.add_argument('--okta-token-env', default='OKTA_API_TOKEN',
+                        help="Environment variable holding the Okta API token")
+    parser.add_argument('--okta-types', nargs='+', default=DEFAULT_OKTA_TYPES)
+    parser.add_argument('--partitioned', action='store_true', help="Split large Okta types into parallel slices")
+    parser.add_argument('--gcp-project', action='append', help="GCP project ID (repeatable)")
+    parser.add_argument('--gcp-zone', default='europe-west2-a')
+    parser.add_argument('--gcp-credentials', help="Path to a service account JSON key")
+    parser.add_argument('--gcp-types', nargs='+', default=DEFAULT_GCP_TYPES)
+    parser.add_argument('--gcp-asset-inventory', action='store_true',
+                        help="Discover every GCP type with one Cloud Asset Inventory search per project")
+    parser.add_argument('--replay', action='store_true',
+                        help="Regenerate import files from the saved snapshots instead of calling any API")
+    parser.add_argument('--plan', action='store_true',
+                        help="Run terraform plan in each output directory once the import files are written")
+    parser.add_argument('--check', action='store_true',
+                        help="With --plan, finish with a plain terraform plan over the imports and configuration")
+    parser.add_argument('--max-plan-errors', type=int,
+                        help="Stop a plan once it has reported this many errors (default: run to completion)")
+    parser.add_argument('--prometheus-textfile',
+                        help="Also write run metrics here, e.g. into the node exporter's textfile directory")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for batch mode.  Returns a non-zero exit code if any collector failed."""
+    config = config_from_args(parse_args(argv))
+    if not config['okta'] and not config['gcp'] and not config.get('replay'):
+        print("Nothing to do: pass --config or at least one --okta-org / --gcp-project.")
+        return 2
+
+    started = time.monotonic()
+    METRICS.reset()
+    if config.get('replay'):
+        # Replay reads only local snapshots: no provider lookups, tokens or API calls.
+        directories = replay_dirs(config)
+        results = run_jobs(build_replay_jobs(config), config.get('max_workers', DEFAULT_WORKERS))
+    else:
+        directories = output_dirs(config)
+        results = run_batch(config)
+    failed = [label for label, result in results.items() if 'error' in result]
+    print(f"\nBatch finished in {time.monotonic() - started:.1f}s: "
+          f"{len(results) - len(failed)} succeeded, {len(failed)} failed.")
+    if config.get('plan') and not plan_dirs(directories, config.get('check', False), config.get('max_plan_errors')):
+        failed.append('plan')
+    METRICS.print_summary()
+    output_dir = config.get('output_dir', '.')
+    os.makedirs(output_dir, exist_ok=True)
+    export_metrics(os.path.join(output_dir, REPORT_FILE), config.get('prometheus_textfile'))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
@@ -0,0 +1,366 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# What a cold start has to do: load the entry points and list every service.
+STARTUP_SNIPPET = "import main, batch, handler_registry; handler_registry.list_services()"
+# SDKs that must not be imported until a resource is actually fetched.
+HEAVY_MODULES = ("google.cloud", "google.api_core", "google.auth", "grpc")
+STARTUP_BUDGET = float(os.environ.get("TERRAFORM_IMPORTER_STARTUP_BUDGET", "0.5"))
+
+PIPELINE_STAGES = ("okta_fetch", "gcp_fetch", "gcp_search", "import_script", "replay", "dedupe")
+PIPELINE_SIZES = (1000, 100000, 1000000)
+# A drop in records/sec or a rise in peak RSS beyond this fraction of the baseline fails the run.
+REGRESSION_TOLERANCE = 0.2
+
+
+def _time_python(code: str) -> Tuple[float, str, str]:
+    """Run code in a fresh interpreter with -X importtime.  Returns (seconds, stdout, stderr)."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    return time.perf_counter() - started, result.stdout, result.stderr
+
+
+def slowest_imports(importtime_log: str, count: int = 5) -> List[Tuple[str, int]]:
+    """Return the slowest top-level imports (module, cumulative microseconds) from an -X importtime log."""
+    imports = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented; only the top level adds up to the total.
+        if not name.startswith("  "):
+            imports.append((name.strip(), int(cumulative)))
+    return sorted(imports, key=lambda item: item[1], reverse=True)[:count]
+
+
+def benchmark_startup(runs: int = 5, budget: float = STARTUP_BUDGET) -> bool:
+    """Measure cold-start import time over a bare interpreter.  Returns False if it is over budget."""
+    heavy_check = f"; import sys; print(','.join(m for m in sys.modules if m.startswith({HEAVY_MODULES!r})))"
+    baseline = statistics.median(_time_python("pass")[0] for _ in range(runs))
+
+    timings = []
+    for _ in range(runs):
+        seconds, stdout, stderr = _time_python(STARTUP_SNIPPET + heavy_check)
+        timings.append(seconds)
+    overhead = statistics.median(timings) - baseline
+    heavy = [module for module in stdout.strip().split(",") if module]
+
+    print(f"Cold start: {statistics.median(timings):.3f}s median over {runs} runs "
+          f"({overhead:.3f}s over a bare interpreter, budget {budget:.3f}s)")
+    print("Slowest imports:")
+    for module, cumulative in slowest_imports(stderr):
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+
+    ok = True
+    if heavy:
+        print(f"FAIL: heavy SDK modules imported at startup: {', '.join(sorted(heavy)[:10])}")
+        ok = False
+    if overhead > budget:
+        print(f"FAIL: cold start is {overhead - budget:.3f}s over budget")
+        ok = False
+    if ok:
+        print("OK: cold start is within budget")
+    return ok
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _bench_users(size: int):
+    from fake_servers import okta_user
+    from records import project_okta_user
+    return [project_okta_user(okta_user(index)) for index in range(size)]
+
+
+def run_stage(stage: str, size: int, okta_url: Optional[str] = None) -> Dict:
+    """Run one pipeline stage over `size` resources in this process and measure it.
+
+    okta_fetch:    get_okta_resources against the fake Okta server at okta_url
+    gcp_fetch:     discover_gcp_projects for instances and buckets, with the fake GCP pager as the clients
+    gcp_search:    the same resources through Cloud Asset Inventory, as one search stream
+    import_script: write import blocks for `size` users
+    replay:        regenerate the import file for `size` users from a saved snapshot
+    dedupe:        allocate `size` addresses, a tenth of them colliding names
+    """
+    from terraform_utils import AddressAllocator, create_terraform_import_script
+
+    work_dir = tempfile.mkdtemp(prefix=f"bench_{stage}_")
+    records = None
+    if stage == "import_script":
+        records = _bench_users(size)
+    elif stage == "replay":
+        from snapshots import snapshot_file, write_snapshot
+        write_snapshot(snapshot_file("okta", "users", work_dir), "users", _bench_users(size))
+
+    started = time.perf_counter()
+    if stage == "okta_fetch":
+        from okta_handler import get_okta_resources
+        count = len(get_okta_resources("bench", "token", okta_url, "users", output_dir=work_dir))
+    elif stage in ("gcp_fetch", "gcp_search"):
+        import gcp_handler
+        from fake_servers import FakeGcpPager
+        pager = FakeGcpPager(instances=size - size // 2, buckets=size // 2)
+        # The pager stands in for the cached clients, so discovery, paging and projection all run as in an import.
+        gcp_handler.get_instances_client = lambda credentials_file=None: pager
+        gcp_handler.get_storage_client = lambda project_id, credentials_file=None: pager
+        gcp_handler.get_asset_client = lambda credentials_file=None: pager
+        discovered = gcp_handler.discover_gcp_projects([pager.project_id], ["instances", "buckets"],
+                                                       use_asset_inventory=stage == "gcp_search")
+        count = sum(len(records) for records in discovered[pager.project_id].values())
+    elif stage == "import_script":
+        create_terraform_import_script(records, "users", verbose=False, allocator=AddressAllocator(),
+                                       output_dir=work_dir)
+        count = size
+    elif stage == "replay":
+        from snapshots import iter_snapshot, snapshot_file
+        create_terraform_import_script(iter_snapshot(snapshot_file("okta", "users", work_dir)), "users", verbose=False,
+                                       allocator=AddressAllocator(), output_dir=work_dir)
+        count = size
+    elif stage == "dedupe":
+        allocator = AddressAllocator()
+        for index in range(size):
+            allocator.allocate("okta_user", f"user_{index % max(size // 10, 1)}", f"00u{index:017d}")
+        count = len(allocator)
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+    seconds = time.perf_counter() - started
+
+    return {
+        "stage": stage,
+        "size": size,
+        "records": count,
+        "seconds": round(seconds, 3),
+        "records_per_sec": round(count / seconds) if seconds else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def _run_stage_subprocess(stage: str, size: int, okta_url: Optional[str]) -> Dict:
+    """Run a stage in a fresh interpreter, so peak RSS belongs to that stage alone."""
+    command = [sys.executable, os.path.abspath(__file__), "stage", stage, str(size)]
+    if okta_url:
+        command += ["--okta-url", okta_url]
+    result = subprocess.run(command, cwd=REPO_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{stage} at {size} failed:\n{result.stderr[-2000:]}")
+    # Handlers print progress; the measurement is the last line.
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare_to_baseline(results: List[Dict], baseline: List[Dict], tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """Return a message for every stage that got slower or bigger than the baseline allows."""
+    previous = {(entry["stage"], entry["size"]): entry for entry in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result["stage"], result["size"]))
+        if not before:
+            continue
+        label = f"{result['stage']} @ {result['size']}"
+        if before["records_per_sec"] and result["records_per_sec"] < before["records_per_sec"] * (1 - tolerance):
+            regressions.append(f"{label}: {result['records_per_sec']} records/sec, "
+                               f"baseline {before['records_per_sec']}")
+        if result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{label}: peak RSS {result['peak_rss_mb']} MB, baseline {before['peak_rss_mb']} MB")
+    return regressions
+
+
+def benchmark_pipeline(sizes=PIPELINE_SIZES, stages=PIPELINE_STAGES, latency: float = 0.0,
+                       throttle_rate: float = 0.0, output: Optional[str] = None,
+                       baseline: Optional[str] = None) -> bool:
+    """Measure every stage at every size against the local fake servers.  Returns False on a regression."""
+    from fake_servers import FakeOktaServer
+
+    results = []
+    print(f"{'stage':<14} {'size':>9} {'seconds':>9} {'records/s':>11} {'peak RSS':>10}")
+    for size in sizes:
+        # A one-second window keeps injected 429s from stalling the run for a full minute.
+        with FakeOktaServer({"users": size}, latency=latency, window=1.0, throttle_rate=throttle_rate) as server:
+            for stage in stages:
+                result = _run_stage_subprocess(stage, size, server.url)
+                results.append(result)
+                print(f"{stage:<14} {size:>9} {result['seconds']:>9.2f} {result['records_per_sec'] or 0:>11} "
+                      f"{result['peak_rss_mb']:>7.1f} MB")
+            if "okta_fetch" in stages:
+                print(f"{'':<14} fake Okta: {server.requests} requests, {server.throttled} throttled")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {output}")
+
+    if not baseline:
+        return True
+    with open(baseline, "r") as f:
+        regressions = compare_to_baseline(results, json.load(f))
+    for message in regressions:
+        print(f"FAIL: {message}")
+    if not regressions:
+        print(f"OK: no regressions against {baseline}")
+    return not regressions
+
+
+def check_fan_out_error_stops_workers() -> Optional[str]:
+    """A failed membership sub-crawl must stop the page workers, not leave them blocked on a full queue."""
+    import threading
+    import okta_crawler
+    from fake_servers import FakeOktaServer
+
+    crawl = okta_crawler.OktaFanOut._crawl
+    calls = []
+
+    def failing_crawl(self, resource_type, parent):
+        calls.append(parent.id)
+        if len(calls) == 5:
+            raise RuntimeError("injected fan-out failure")
+        return crawl(self, resource_type, parent)
+
+    before = set(threading.enumerate())
+    error = None
+    okta_crawler.OktaFanOut._crawl = failing_crawl
+    try:
+        # Enough user pages across the partitions to fill the page queue once the consumer stops.
+        with FakeOktaServer({"users": 20000, "groups": 50}) as server:
+            try:
+                for _ in okta_crawler.stream_okta_resources("bench", "token", server.url,
+                                                            ["users", "group_memberships"], partitioned=True):
+                    pass
+            except RuntimeError as e:
+                # Held, as an uncaught exception's traceback would be, so nothing is closed by garbage collection.
+                error = e
+    finally:
+        okta_crawler.OktaFanOut._crawl = crawl
+    if error is None:
+        return "the injected fan-out error was not raised"
+
+    deadline = time.monotonic() + 10
+    while True:
+        left = [thread for thread in threading.enumerate()
+                if thread not in before and thread.is_alive() and not thread.daemon]
+        if not left:
+            return None
+        if time.monotonic() > deadline:
+            return f"{len(left)} crawl thread(s) still running after a fan-out error"
+        time.sleep(0.1)
+
+
+def check_import_files_ignore_arrival_order() -> Optional[str]:
+    """Colliding names must get the same addresses, and so the same files, whatever order the records arrive in."""
+    import random
+    from fake_servers import okta_user
+    from records import project_okta_user
+    from terraform_utils import AddressAllocator, create_terraform_import_script
+
+    users = []
+    for index in range(2000):
+        user = okta_user(index)
+        # 40 users per name, plus names that look like another name's suffixed address.
+        user["profile"].update(firstName=f"User{index % 50}", lastName="Bench" if index % 100 else "Bench_1")
+        users.append(project_okta_user(user))
+
+    outputs = []
+    with tempfile.TemporaryDirectory(prefix="import-order-check-") as root:
+        for seed in (1, 2):
+            random.Random(seed).shuffle(users)
+            output_dir = os.path.join(root, str(seed))
+            os.makedirs(output_dir)
+            create_terraform_import_script(users, "users", verbose=False, allocator=AddressAllocator(),
+                                           output_dir=output_dir)
+            files = {}
+            for name in ("output_file_users.tf", "generated_users.tf"):
+                with open(os.path.join(output_dir, name), "rb") as f:
+                    files[name] = f.read()
+            outputs.append(files)
+    for name, data in outputs[0].items():
+        if outputs[1][name] != data:
+            return f"{name} differs between two arrival orders of the same records"
+    return None
+
+
+# Regression checks run by `benchmark.py check`: name -> function returning a failure message, or None.
+CHECKS = {
+    "fan_out_error_stops_workers": check_fan_out_error_stops_workers,
+    "import_files_ignore_arrival_order": check_import_files_ignore_arrival_order,
+}
+
+
+def run_checks(names: Optional[List[str]] = None) -> bool:
+    """Run the regression checks.  Returns False if any failed."""
+    ok = True
+    for name in names or CHECKS:
+        started = time.perf_counter()
+        failure = CHECKS[name]()
+        status = f"FAIL: {failure}" if failure else "OK"
+        print(f"{name:<40} {time.perf_counter() - started:6.2f}s  {status}")
+        ok = ok and failure is None
+    return ok
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Performance benchmarks for the resource importer.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    startup = subparsers.add_parser("startup", help="Fail if cold start exceeds the import-time budget")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--budget", type=float, default=STARTUP_BUDGET,
+                         help="Allowed seconds over a bare interpreter (default: %(default)s)")
+
+    pipeline = subparsers.add_parser("pipeline", help="Measure fetch, import generation and dedupe "
+                                                      "against local fake Okta and GCP servers")
+    pipeline.add_argument("--sizes", default=",".join(str(size) for size in PIPELINE_SIZES),
+                          help="Comma separated resource counts, e.g. 1000,100000,1000000")
+    pipeline.add_argument("--stages", default=",".join(PIPELINE_STAGES))
+    pipeline.add_argument("--latency", type=float, default=0.0, help="Seconds added to every fake Okta response")
+    pipeline.add_argument("--throttle-rate", type=float, default=0.0,
+                          help="Share of fake Okta requests answered with a 429")
+    pipeline.add_argument("--output", help="Write the results to this JSON file (e.g. to keep as a baseline)")
+    pipeline.add_argument("--baseline", help="Fail if results regress against this earlier --output file")
+
+    check = subparsers.add_parser("check", help="Run the regression checks against the local fake servers")
+    check.add_argument("checks", nargs="*", choices=[[]] + list(CHECKS), help="Checks to run (default: all)")
+
+    stage = subparsers.add_parser("stage")
+    stage.add_argument("stage", choices=PIPELINE_STAGES)
+    stage.add_argument("size", type=int)
+    stage.add_argument("--okta-url")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.command == "startup":
+        return 0 if benchmark_startup(args.runs, args.budget) else 1
+    if args.command == "pipeline":
+        sizes = [int(size) for size in args.sizes.split(",")]
+        stages = [stage.strip() for stage in args.stages.split(",")]
+        ok = benchmark_pipeline(sizes, stages, args.latency, args.throttle_rate, args.output, args.baseline)
+        return 0 if ok else 1
+    if args.command == "check":
+        return 0 if run_checks(args.checks) else 1
+    if args.command == "stage":
+        # Used by the pipeline benchmark to measure each stage in its own process.
+        print(json.dumps(run_stage(args.stage, args.size, args.okta_url)))
+        return 0
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
@@ -0,0 +1,122 @@
+import glob
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Optional
+
+JOURNAL_ROOT = os.path.join(".terraform_importer", "journal")
+# A journal older than this is treated as stale and the crawl starts over.
+JOURNAL_MAX_AGE = 24 * 60 * 60
+# Records per page when replaying a journal.
+REPLAY_PAGE_SIZE = 1000
+JOB_DIGEST_LENGTH = 10
+
+
+def _write_json_atomic(path: str, data: Dict) -> None:
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(f"{path}.tmp", path)
+
+
+class JobJournal:
+    """The journal of one crawl job: one resource type, optionally one partition of it.
+
+    Every page is appended to {key}.ndjson and then the checkpoint
+    ({key}.checkpoint.json) is replaced atomically with the next page's URL
+    and the journal's length.  The checkpoint is only written once the page
+    is on disk, so it never points past what the journal holds; anything
+    after its offset is a torn write and is cut off on resume.
+    """
+
+    def __init__(self, directory: str, key: str):
+        self.records_path = os.path.join(directory, f"{key}.ndjson")
+        self.checkpoint_path = os.path.join(directory, f"{key}.checkpoint.json")
+        self.state: Optional[Dict] = None
+        self._file = None
+
+    def load(self) -> Optional[Dict]:
+        """Load a usable checkpoint, or clear the journal and return None if there isn't one."""
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                state = json.load(f)
+            if time.time() - state["started"] > JOURNAL_MAX_AGE:
+                raise ValueError("stale journal")
+            with open(self.records_path, "r+b") as f:
+                f.truncate(state["offset"])
+        except (IOError, ValueError, KeyError):
+            self.discard()
+            return None
+        self.state = state
+        return state
+
+    def replay(self) -> Iterator[List[Dict]]:
+        """Yield the journaled items, in pages, up to the last checkpoint."""
+        if not self.state or not self.state["offset"]:
+            return
+        page = []
+        with open(self.records_path, "rb") as f:
+            for line in f:
+                page.append(json.loads(line))
+                if len(page) == REPLAY_PAGE_SIZE:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+    def append(self, items: List[Dict], next_url: Optional[str]) -> None:
+        """Journal a fetched page and checkpoint the URL of the page after it (None once the job is done)."""
+        if self._file is None:
+            self._file = open(self.records_path, "ab")
+        data = b"".join(json.dumps(item, separators=(",", ":")).encode() + b"\n" for item in items)
+        self._file.write(data)
+        self._file.flush()
+
+        state = self.state or {"started": time.time(), "offset": 0, "pages": 0, "items": 0}
+        state.update(next_url=next_url, complete=next_url is None, offset=state["offset"] + len(data),
+                     pages=state["pages"] + 1, items=state["items"] + len(items))
+        _write_json_atomic(self.checkpoint_path, state)
+        self.state = state
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self) -> None:
+        self.close()
+        for path in (self.records_path, self.checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.state = None
+
+
+class CrawlJournal:
+    """Checkpoints for one org's crawl, so an interrupted crawl resumes where it stopped.
+
+    Each (resource type, partition) job gets its own JobJournal.  A rerun
+    replays what the journals already hold without calling the API, then
+    continues from each job's last checkpointed cursor.  Call clear() once
+    a crawl's output has been written.
+    """
+
+    def __init__(self, org_url: str, output_dir: str = "."):
+        org_key = hashlib.sha1(org_url.encode()).hexdigest()[:12]
+        self.directory = os.path.join(output_dir, JOURNAL_ROOT, org_key)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def job(self, resource_type: str, partition: Optional[Dict] = None) -> JobJournal:
+        # The partition's query parameters identify the slice; page limits and cursors are in the URLs.
+        partition_key = json.dumps(partition or {}, sort_keys=True)
+        digest = hashlib.sha1(partition_key.encode()).hexdigest()[:JOB_DIGEST_LENGTH]
+        return JobJournal(self.directory, f"{resource_type}_{digest}")
+
+    def clear(self, resource_types: List[str]) -> None:
+        """Remove the journals of the given resource types, leaving those of crawls still running."""
+        for resource_type in resource_types:
+            for path in glob.glob(os.path.join(self.directory, f"{resource_type}_{'?' * JOB_DIGEST_LENGTH}.*")):
+                os.remove(path)
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
@@ -0,0 +1,342 @@
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+# Local stand-ins for the Okta API and the GCP list calls, used by benchmark.py.
+# Resources are generated from their index on demand, so a million-user org
+# costs no memory on the server side and is identical on every run.
+
+USER_STATUSES = ("ACTIVE", "STAGED", "PROVISIONED", "SUSPENDED", "LOCKED_OUT")
+GROUP_TYPES = ("OKTA_GROUP", "OKTA_GROUP", "APP_GROUP")
+APP_STATUSES = ("ACTIVE", "ACTIVE", "INACTIVE")
+APP_SIGN_ON_MODES = ("SAML_2_0", "OPENID_CONNECT", "BOOKMARK", "AUTO_LOGIN")
+GCP_ZONES = ("europe-west2-a", "europe-west2-b", "europe-west2-c", "us-central1-a")
+
+_EPOCH = datetime(2024, 1, 1)
+_CLAUSE = re.compile(r'(\w+)\s+(eq|gt|ge|lt)\s+"([^"]*)"')
+
+
+def _timestamp(index: int) -> str:
+    """A lastUpdated value that grows with the index, one minute apart."""
+    return (_EPOCH + timedelta(minutes=index)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def okta_user(index: int) -> Dict:
+    # First names repeat so address deduplication has collisions to resolve.
+    return {
+        "id": f"00u{index:017d}",
+        "status": USER_STATUSES[index % len(USER_STATUSES)],
+        # An hour apart, so created-date slices over a few days split the users.
+        "created": _timestamp(index * 60),
+        "lastUpdated": _timestamp(index),
+        "profile": {
+            "firstName": f"User{index % 5000}",
+            "lastName": f"Bench{index // 5000}",
+            "login": f"user{index}@example.com",
+            "email": f"user{index}@example.com",
+        },
+        "_links": {"self": {"href": f"/api/v1/users/00u{index:017d}"}},
+    }
+
+
+def okta_group(index: int) -> Dict:
+    # Like a real org, the first group is the built-in Everyone group.
+    return {
+        "id": f"00g{index:017d}",
+        "type": "BUILT_IN" if index == 0 else GROUP_TYPES[index % len(GROUP_TYPES)],
+        "lastUpdated": _timestamp(index),
+        "profile": {"name": "Everyone" if index == 0 else f"Group {index}", "description": f"Benchmark group {index}"},
+    }
+
+
+def okta_app(index: int) -> Dict:
+    return {
+        "id": f"0oa{index:017d}",
+        "name": f"bench_app_{index}",
+        "label": f"App {index}",
+        "status": APP_STATUSES[index % len(APP_STATUSES)],
+        "signOnMode": APP_SIGN_ON_MODES[index % len(APP_SIGN_ON_MODES)],
+        "lastUpdated": _timestamp(index),
+    }
+
+
+OKTA_GENERATORS = {"users": okta_user, "groups": okta_group, "apps": okta_app}
+# Sub-collections: (parent collection, child collection) -> child collection served under /{parent}/{id}/.
+OKTA_SUB_COLLECTIONS = {("groups", "users"): "users", ("apps", "groups"): "groups"}
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections when dozens of crawl workers connect at once.
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def _matches(item: Dict, clauses: List[Tuple[str, str, str]]) -> bool:
+    for field, operator, value in clauses:
+        actual = item.get(field)
+        if operator == "eq" and actual != value:
+            return False
+        if operator == "gt" and not (actual and actual > value):
+            return False
+        if operator == "ge" and not (actual and actual >= value):
+            return False
+        if operator == "lt" and not (actual and actual < value):
+            return False
+    return True
+
+
+class FakeOktaServer:
+    """A local Okta API serving synthetic users, groups and apps.
+
+    Lists follow Okta's `Link: rel="next"` pagination and `search`/`filter`
+    clauses on status, type, created and lastUpdated.  Each group has
+    `members_per_group` users (/groups/{id}/users) and each app is assigned
+    to `groups_per_app` groups (/apps/{id}/groups).  Every response carries
+    X-Rate-Limit-* headers for a per-endpoint window; requests over the limit,
+    plus a random `throttle_rate` share of the rest, get a 429.  `latency`
+    seconds are added to every response.
+    """
+
+    def __init__(self, counts: Dict[str, int], latency: float = 0.0, rate_limit: int = 100000,
+                 window: float = 60.0, throttle_rate: float = 0.0, seed: int = 0,
+                 members_per_group: int = 20, groups_per_app: int = 3):
+        self.counts = counts
+        self.members_per_group = members_per_group
+        self.groups_per_app = groups_per_app
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.window = window
+        self.throttle_rate = throttle_rate
+        self.requests = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._windows: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOktaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOktaServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _take_budget(self, endpoint: str) -> Tuple[bool, int, float]:
+        """Count a request against its endpoint window.  Returns (allowed, remaining, reset epoch)."""
+        with self._lock:
+            self.requests += 1
+            now = time.time()
+            window = self._windows.get(endpoint)
+            if window is None or now >= window[1]:
+                window = self._windows[endpoint] = [self.rate_limit, now + self.window]
+            injected = self.throttle_rate and self._random.random() < self.throttle_rate
+            if window[0] <= 0 or injected:
+                self.throttled += 1
+                return False, int(window[0]), window[1]
+            window[0] -= 1
+            return True, int(window[0]), window[1]
+
+    def children(self, parent: str, parent_id: str, child: str):
+        """Return (generate, count) for a sub-collection, or None if the parent does not exist."""
+        try:
+            parent_index = int(parent_id[3:])
+        except ValueError:
+            return None
+        child_count = self.counts.get(child, 0)
+        if parent_index >= self.counts.get(parent, 0) or not child_count:
+            return None
+        if parent == "groups":
+            # Spread members over the org; a prime stride keeps neighbouring groups from sharing members.
+            count = min(self.members_per_group, child_count)
+            return (lambda position: okta_user((parent_index * 7919 + position) % child_count)), count
+        count = min(self.groups_per_app, child_count)
+        return (lambda position: okta_group((parent_index * 31 + position) % child_count)), count
+
+    def page(self, endpoint: str, query: Dict[str, str], generate=None,
+             count: Optional[int] = None) -> Tuple[List[Dict], Optional[int]]:
+        """Return one page of a listing and the cursor of the next page (None on the last page)."""
+        generate = generate or OKTA_GENERATORS[endpoint]
+        count = self.counts.get(endpoint, 0) if count is None else count
+        clauses = _CLAUSE.findall(" ".join(query.get(key, "") for key in ("search", "filter")))
+        limit = int(query.get("limit", 200))
+        # The cursor is the raw index to resume from, so filtered pages never rescan earlier items.
+        index = int(query.get("after", 0))
+        items = []
+        while index < count and len(items) < limit:
+            item = generate(index)
+            index += 1
+            if _matches(item, clauses):
+                items.append(item)
+        return items, (index if index < count else None)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real API; every response sets Content-Length.
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send(self, status: int, body: bytes, headers: Dict[str, str]) -> None:
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                if server.latency:
+                    time.sleep(server.latency)
+                parsed = urlparse(self.path)
+                parts = parsed.path.rstrip("/").split("/")[3:]
+                endpoint, children = (parts[0] if parts else None), None
+                if len(parts) == 3 and (parts[0], parts[2]) in OKTA_SUB_COLLECTIONS:
+                    endpoint = OKTA_SUB_COLLECTIONS[(parts[0], parts[2])]
+                    children = server.children(parts[0], parts[1], parts[2])
+                    found = children is not None
+                else:
+                    found = len(parts) == 1 and endpoint in OKTA_GENERATORS
+                if not parsed.path.startswith("/api/v1/") or not found:
+                    self._send(404, b'{"errorCode": "E0000007"}', {})
+                    return
+
+                # Like Okta, sub-collections of every parent share one rate-limit bucket.
+                bucket = f"{parts[0]}/{{id}}/{parts[2]}" if children else endpoint
+                allowed, remaining, reset = server._take_budget(bucket)
+                headers = {
+                    "X-Rate-Limit-Limit": str(server.rate_limit),
+                    "X-Rate-Limit-Remaining": str(remaining),
+                    "X-Rate-Limit-Reset": str(math.ceil(reset)),
+                }
+                if not allowed:
+                    self._send(429, b'{"errorCode": "E0000047"}', headers)
+                    return
+
+                query = dict(parse_qsl(parsed.query))
+                items, cursor = server.page(endpoint, query, *(children or ()))
+                if cursor is not None:
+                    query["after"] = str(cursor)
+                    headers["Link"] = f'<{server.url}{parsed.path}?{urlencode(query)}>; rel="next"'
+                self._send(200, json.dumps(items).encode(), headers)
+
+        return Handler
+
+
+def gcp_instance(index: int, project_id: str = "bench-project") -> SimpleNamespace:
+    """A Compute Engine instance with the attributes the SDK message exposes."""
+    zone = GCP_ZONES[index % len(GCP_ZONES)]
+    name = f"vm-{index}"
+    return SimpleNamespace(
+        id=10 ** 15 + index,
+        name=name,
+        zone=f"https://www.googleapis.com/compute/v1/projects/{project_id}/zones/{zone}",
+        machine_type=f"https://www.googleapis.com/compute/v1/projects/{project_id}/zones/{zone}/machineTypes/e2-small",
+        status="RUNNING",
+        self_link=f"https://www.googleapis.com/compute/v1/projects/{project_id}/zones/{zone}/instances/{name}",
+        disks=[SimpleNamespace(
+            boot=True, source=f"https://www.googleapis.com/compute/v1/projects/{project_id}/zones/{zone}/disks/{name}")],
+        network_interfaces=[SimpleNamespace(
+            network=f"https://www.googleapis.com/compute/v1/projects/{project_id}/global/networks/default",
+            subnetwork=f"https://www.googleapis.com/compute/v1/projects/{project_id}/regions/{zone[:-2]}/subnetworks/default",
+            access_configs=[SimpleNamespace(name="External NAT")] if index % 2 else [])],
+    )
+
+
+def gcp_bucket(index: int, project_id: str = "bench-project") -> SimpleNamespace:
+    """A storage bucket with the attributes the SDK Bucket exposes."""
+    name = f"{project_id}-bucket-{index}"
+    return SimpleNamespace(
+        name=name,
+        location="EUROPE-WEST2",
+        storage_class="STANDARD",
+        self_link=f"https://www.googleapis.com/storage/v1/b/{name}",
+    )
+
+
+def gcp_asset(asset_type: str, index: int, project_id: str = "bench-project") -> SimpleNamespace:
+    """A Cloud Asset Inventory search result for a synthetic instance or bucket."""
+    if asset_type == "compute.googleapis.com/Instance":
+        zone = GCP_ZONES[index % len(GCP_ZONES)]
+        name, location = f"//compute.googleapis.com/projects/{project_id}/zones/{zone}/instances/vm-{index}", zone
+    else:
+        name, location = f"//storage.googleapis.com/{project_id}-bucket-{index}", "europe-west2"
+    return SimpleNamespace(name=name, asset_type=asset_type, project="projects/123456789012", location=location,
+                           update_time=None, additional_attributes={})
+
+
+class FakeGcpPager:
+    """Stand-in for the GCP list pagers: yields synthetic instances and buckets page by page.
+
+    `aggregated_list` mirrors InstancesClient.aggregated_list (one (zone, scoped
+    list) pair per zone and page), `list_buckets` mirrors
+    storage.Client.list_buckets and `search_all_resources` mirrors
+    AssetServiceClient.search_all_resources.  `latency` seconds are added per page.
+    """
+
+    def __init__(self, instances: int = 0, buckets: int = 0, project_id: str = "bench-project",
+                 page_size: int = 500, latency: float = 0.0):
+        self.instances = instances
+        self.buckets = buckets
+        self.project_id = project_id
+        self.page_size = page_size
+        self.latency = latency
+        self.pages = 0
+
+    def _pages(self, count: int) -> Iterator[range]:
+        for start in range(0, count, self.page_size):
+            if self.latency:
+                time.sleep(self.latency)
+            self.pages += 1
+            yield range(start, min(start + self.page_size, count))
+
+    def aggregated_list(self, request=None) -> Iterator[Tuple[str, SimpleNamespace]]:
+        for page in self._pages(self.instances):
+            by_zone: Dict[str, list] = {}
+            for index in page:
+                by_zone.setdefault(GCP_ZONES[index % len(GCP_ZONES)], []).append(gcp_instance(index, self.project_id))
+            for zone, instances in by_zone.items():
+                yield f"zones/{zone}", SimpleNamespace(instances=instances, warning=SimpleNamespace(code="", message=""))
+
+    def list_buckets(self) -> Iterator[SimpleNamespace]:
+        for page in self._pages(self.buckets):
+            for index in page:
+                yield gcp_bucket(index, self.project_id)
+
+    def search_all_resources(self, request=None) -> Iterator[SimpleNamespace]:
+        # Instances then buckets, in one stream paged across both, filtered by the request's asset types.
+        counts = {"compute.googleapis.com/Instance": self.instances, "storage.googleapis.com/Bucket": self.buckets}
+        asset_types = (request or {}).get("asset_types") or list(counts)
+        matches = [(asset_type, index) for asset_type in asset_types for index in range(counts.get(asset_type, 0))]
+        for page in self._pages(len(matches)):
+            for position in page:
+                yield gcp_asset(*matches[position], self.project_id)
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
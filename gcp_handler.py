@@ -1,101 +1,275 @@
-from google.cloud import compute, storage, iam_admin
-from google.api_core import exceptions
+# The google-cloud SDKs are slow to import, so they are imported inside the
+# functions that use them rather than here.  Keep this module's top level light.
+import functools
+import time
 import terraform_utils
+from handler_registry import get_service
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional
+from records import GCP_ASSET_TYPES, ResourceRecord, project_gcp_asset, project_records
+from metrics import add_phase
+from snapshots import snapshot_file, write_snapshot
 from terraform_utils import get_latest_provider_version, create_provider_block, create_terraform_config, create_terraform_import_script
-import json
 
-def get_gcp_compute_instances(project_id, zone):
-    """Retrieves a list of Compute Engine instances for a project and zone."""
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+AGGREGATED_PAGE_SIZE = 500
+ASSET_PAGE_SIZE = 500
+# Only these fields of each search result are returned; they are all the projection reads.
+ASSET_READ_MASK = ["name", "asset_type", "project", "location", "update_time", "additional_attributes"]
+ASSET_SCOPE_PREFIXES = ("projects/", "folders/", "organizations/")
+DEFAULT_PROJECT_WORKERS = 8
+# The aggregatedList warning for a zone that simply has no instances.
+NO_RESULTS_WARNING = "NO_RESULTS_ON_PAGE"
+
+if TYPE_CHECKING:
+    from google.cloud import asset_v1, compute_v1, storage
+
+@functools.lru_cache(maxsize=None)
+def get_credentials(credentials_file: Optional[str] = None):
+    """Load credentials once per key file (or application default credentials) and reuse them."""
+    import google.auth
+    from google.oauth2 import service_account
+
+    if credentials_file:
+        return service_account.Credentials.from_service_account_file(credentials_file, scopes=[CLOUD_PLATFORM_SCOPE])
+    credentials, _ = google.auth.default(scopes=[CLOUD_PLATFORM_SCOPE])
+    return credentials
+
+@functools.lru_cache(maxsize=None)
+def get_instances_client(credentials_file: Optional[str] = None) -> "compute_v1.InstancesClient":
+    """Return a cached Compute Engine client; one client serves every project."""
     from google.cloud import compute_v1
 
-    client = compute_v1.InstancesClient()
-    request = compute_v1.ListInstancesRequest(
-        project=project_id,
-        zone=zone,
-    )
+    return compute_v1.InstancesClient(credentials=get_credentials(credentials_file))
+
+@functools.lru_cache(maxsize=None)
+def get_storage_client(project_id: str, credentials_file: Optional[str] = None) -> "storage.Client":
+    """Return a cached Cloud Storage client for a project."""
+    from google.cloud import storage
+
+    return storage.Client(project=project_id, credentials=get_credentials(credentials_file))
+
+@functools.lru_cache(maxsize=None)
+def get_asset_client(credentials_file: Optional[str] = None) -> "asset_v1.AssetServiceClient":
+    """Return a cached Cloud Asset Inventory client."""
+    from google.cloud import asset_v1
+
+    return asset_v1.AssetServiceClient(credentials=get_credentials(credentials_file))
+
+def get_gcp_compute_instances(project_id, zone=None, credentials_file: Optional[str] = None):
+    """Retrieves a list of Compute Engine instances for a project, in one zone or (by default) every zone.
+
+    Errors are raised rather than returning what was listed so far, so a
+    failed listing never replaces the last complete snapshot and import file.
+    """
+    from google.api_core import exceptions
+    from google.cloud import compute_v1
+
+    client = get_instances_client(credentials_file)
 
     resources = []
     try:
-        page_result = client.list(request=request)
-        for response in page_result:
-            for instance in response.items:
-                resources.append(instance)
-    except exceptions.Forbidden as e: 
-        print(f"Error: Insufficient permissions to list Compute Engine instances: {e}")
-        return []
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        return []
+        if zone:
+            request = compute_v1.ListInstancesRequest(project=project_id, zone=zone, max_results=AGGREGATED_PAGE_SIZE)
+            resources.extend(client.list(request=request))
+        else:
+            # aggregatedList covers every zone of the project in one paged call.  With partial
+            # success a zone it cannot reach only carries a warning, so those are checked below.
+            request = compute_v1.AggregatedListInstancesRequest(
+                project=project_id,
+                max_results=AGGREGATED_PAGE_SIZE,
+                return_partial_success=True,
+            )
+            failed_zones = []
+            for zone_name, scoped_list in client.aggregated_list(request=request):
+                resources.extend(scoped_list.instances)
+                if scoped_list.warning.code and scoped_list.warning.code != NO_RESULTS_WARNING:
+                    failed_zones.append(f"{zone_name} ({scoped_list.warning.code}: {scoped_list.warning.message})")
+            if failed_zones:
+                raise RuntimeError(f"Compute Engine instances in {project_id} could not be listed in "
+                                   f"{len(failed_zones)} zone(s): {', '.join(failed_zones)}")
+    except exceptions.Forbidden as e:
+        print(f"Error: Insufficient permissions to list Compute Engine instances in {project_id}: {e}")
+        raise
     return resources
 
 
-def get_gcp_groups(project_id: str) -> list:
-    client = iam_admin.GroupsClient()
-    groups = []
-    request = iam_admin.ListGroupsRequest(parent=f"projects/{project_id}")
-    page_result = client.list_groups(request=request)
-    for group in page_result:
-        groups.append(group)
-    return groups
-
-def get_gcp_users(project_id: str) -> list:
-    client = iam_admin.IAMClient()
-    users = []
-    request = iam_admin.ListServiceAccountsRequest(parent=f"projects/{project_id}")
-    page_result = client.list_service_accounts(request=request)
-    for user in page_result:
-        users.append(user)
-    return users
-
-def get_gcp_custom_roles(project_id: str) -> list:
-    client = iam_admin.IAMClient()
-    roles = []
-    request = iam_admin.ListRolesRequest(parent=f"projects/{project_id}")
-    page_result = client.list_roles(request=request)
-    for role in page_result:
-        if role.is_custom:
-            roles.append(role)
-    return roles
-
-def get_gcp_buckets(project_id: str) -> list:
-    client = storage.Client(project=project_id)
+def get_gcp_buckets(project_id: str, credentials_file: Optional[str] = None) -> list:
+    client = get_storage_client(project_id, credentials_file)
     buckets = list(client.list_buckets())
     return buckets
 
-def choose_resource_type(project_id, zone):
-    resource_types = {
-        "1": ("Compute Instance", get_gcp_compute_instances),
-        "2": ("Storage Buckets", get_gcp_buckets),
-        #"3": ("Group", get_gcp_groups),
-        #"4": ("Users", get_gcp_users),
-        #"5": ("Custom Roles", get_gcp_custom_roles)
+def asset_scope(scope: str) -> str:
+    """Return a Cloud Asset search scope; a bare project ID becomes projects/{id}."""
+    return scope if scope.startswith(ASSET_SCOPE_PREFIXES) else f"projects/{scope}"
+
+def search_gcp_assets(scope: str, resource_types: List[str], credentials_file: Optional[str] = None,
+                      client=None) -> Dict[str, List[ResourceRecord]]:
+    """Fetch several resource types under a project, folder or organization with one Cloud Asset search.
+
+    The asset types are filtered by the API and every match comes back in a
+    single paged stream, in place of a list call per type, zone and project.
+    Results are projected as the pages arrive.  A failed search raises
+    instead of returning a partial result.
+    """
+    from google.api_core import exceptions
+    from google.protobuf import field_mask_pb2
+
+    client = client or get_asset_client(credentials_file)
+    scope = asset_scope(scope)
+    asset_types = [asset_type for asset_type, (resource_type, _) in GCP_ASSET_TYPES.items()
+                   if resource_type in resource_types]
+    results = {resource_type: [] for resource_type in resource_types}
+    request = {
+        "scope": scope,
+        "asset_types": asset_types,
+        "page_size": ASSET_PAGE_SIZE,
+        "read_mask": field_mask_pb2.FieldMask(paths=ASSET_READ_MASK),
     }
+
+    started = time.perf_counter()
+    try:
+        for result in client.search_all_resources(request=request):
+            record = project_gcp_asset(result)
+            if record is not None:
+                results[GCP_ASSET_TYPES[result.asset_type][0]].append(record)
+    except exceptions.Forbidden as e:
+        print(f"Error: Insufficient permissions to search Cloud Asset Inventory in {scope}: {e}")
+        raise
+    finally:
+        # Paging and projection are interleaved, so the search is timed as one fetch.
+        add_phase("fetch", time.perf_counter() - started)
+    return results
+
+# Import resource type -> (menu label, fetch function)
+GCP_RESOURCE_TYPES = {
+    "instances": ("Compute Instance", get_gcp_compute_instances),
+    "buckets": ("Storage Buckets", get_gcp_buckets),
+}
+
+# Import resource type -> menu label, for types only discovered through Cloud Asset Inventory.
+GCP_ASSET_LABELS = {
+    "disks": "Compute Disks",
+    "networks": "VPC Networks",
+    "subnetworks": "Subnetworks",
+    "firewalls": "Firewall Rules",
+    "service_accounts": "Service Accounts",
+    "custom_roles": "Custom IAM Roles",
+    "sql_instances": "Cloud SQL Instances",
+    "pubsub_topics": "Pub/Sub Topics",
+    "pubsub_subscriptions": "Pub/Sub Subscriptions",
+}
+
+def resource_label(resource_type: str) -> str:
+    if resource_type in GCP_RESOURCE_TYPES:
+        return GCP_RESOURCE_TYPES[resource_type][0]
+    return GCP_ASSET_LABELS[resource_type]
+
+def get_gcp_resources(project_id: str, resource_type: str, zone: str = None,
+                      credentials_file: Optional[str] = None) -> List[ResourceRecord]:
+    """Fetch one GCP resource type as ResourceRecords, ready for saving or import generation."""
+    if resource_type not in GCP_RESOURCE_TYPES:
+        return search_gcp_assets(project_id, [resource_type], credentials_file)[resource_type]
+    _, get_function = GCP_RESOURCE_TYPES[resource_type]
+    started = time.perf_counter()
+    if resource_type == "instances":
+        resources = get_function(project_id, zone, credentials_file)
+    else:
+        resources = get_function(project_id, credentials_file)
+    fetched = time.perf_counter()
+    add_phase("fetch", fetched - started)
+    records = list(project_records(resources, resource_type))
+    add_phase("transform", time.perf_counter() - fetched)
+    return records
+
+def discover_gcp_projects(project_ids: List[str], resource_types: List[str],
+                          credentials_file: Optional[str] = None,
+                          max_workers: int = DEFAULT_PROJECT_WORKERS,
+                          use_asset_inventory: bool = False) -> Dict[str, Dict[str, List[ResourceRecord]]]:
+    """Collect several resource types across many projects on a bounded thread pool.
+
+    Every (project, resource type) pair runs in parallel; clients and
+    credentials are cached, so the fan-out does not rebuild them per call.
+    Instances are listed across all zones with aggregatedList.  With
+    use_asset_inventory, each project is one Cloud Asset search for all of
+    its types instead; types with no list call of their own always are.
+    """
+    searched = [resource_type for resource_type in resource_types
+                if use_asset_inventory or resource_type not in GCP_RESOURCE_TYPES]
+    listed = [resource_type for resource_type in resource_types if resource_type not in searched]
+    results = {project_id: {} for project_id in project_ids}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        searches = {
+            executor.submit(search_gcp_assets, project_id, searched, credentials_file): project_id
+            for project_id in project_ids
+            if searched
+        }
+        futures = {
+            executor.submit(get_gcp_resources, project_id, resource_type, None, credentials_file): (project_id, resource_type)
+            for project_id in project_ids
+            for resource_type in listed
+        }
+        for future, project_id in searches.items():
+            results[project_id].update(future.result())
+        for future, (project_id, resource_type) in futures.items():
+            results[project_id][resource_type] = future.result()
+    return results
+
+def choose_resource_type(project_ids: List[str], credentials_file: Optional[str] = None,
+                         use_asset_inventory: bool = False, scope: Optional[str] = None):
+    resource_types = {str(i + 1): resource_type for i, resource_type in enumerate(get_service("gcp").resource_types)}
     
     while True:
         print("\nSelect a resource type to import:")
         for key, value in resource_types.items(): 
-            print(f"{key}. {value[0]}")
+            print(f"{key}. {resource_label(value)}")
+        print("A. All of the above (collected in parallel)")
         print("0. Exit")
     
         choice = input("Enter your choice: ")
         
-        if choice not in resource_types:
+        if choice.lower() == "a":
+            selected_types = list(resource_types.values())
+        elif choice in resource_types:
+            selected_types = [resource_types[choice]]
+        else:
             print("Invalid choice. Exiting.")
             return
-        print(f"Selected {resource_types[choice][0]}")
-        resource_type, get_function = resource_types[choice]
-        
-        if resource_type == "Compute Instance":
-            resources = get_function(project_id, zone)
-        else:
-            resources = get_function(project_id)
-        
-        print(f"Found {len(resources)} {resource_type} resources.")
-    
+        print(f"Selected {', '.join(resource_label(resource_type) for resource_type in selected_types)}")
+
+        try:
+            if scope:
+                discovered = {scope: search_gcp_assets(scope, selected_types, credentials_file)}
+                searched = scope
+            else:
+                discovered = discover_gcp_projects(project_ids, selected_types, credentials_file,
+                                                   use_asset_inventory=use_asset_inventory)
+                searched = f"{len(project_ids)} project(s)"
+        except Exception as e:
+            print(f"Error: Could not fetch the selected GCP resources: {e}")
+            continue
+
+        for resource_type in selected_types:
+            resources = [resource for project in discovered.values() for resource in project[resource_type]]
+            print(f"Found {len(resources)} {resource_label(resource_type)} resources across {searched}.")
+
+            if not resources:
+                continue
+
+            if input(f"\nWould you like to save the imported {resource_type} to a file? (y/n) ").lower() == "y":
+                write_snapshot(snapshot_file("gcp", resource_type), resource_type, resources)
+
+            if input(f"\nWould you like to create the import file for {resource_type}? (y/n) ").lower() == "y":
+                create_terraform_import_script(resources, resource_type)
+
 
 def gcp():
     latest_version = get_latest_provider_version("google")
-    project_id = input("Enter your GCP Project ID: ")
+    project_ids = [project.strip() for project in input("Enter your GCP Project ID(s), comma separated: ").split(",") if project.strip()]
+    if not project_ids:
+        print("Error: At least one project ID is required.")
+        return
+    project_id = project_ids[0]
     zone = input("Enter the GCP Zone (default: europe-west2-a): ") or "europe-west2-a"
     creds_file = input("Enter the path to or drag and drop your JSON credentials file: ")
     try:
@@ -114,14 +288,14 @@ def gcp():
 
     print("\nTerraform configuration created successfully!")
     
-    choose_resource_type(project_id, zone)
-
-    if input(f"\nWould you like to save the imported {resource_type} to a file? (y/n) ").lower() == "y":
-        with open(f'gcp_{resource_type}.json', 'w') as f:
-            json.dump([resource.to_dict() for resource in resources], f, indent=2)
+    scope = None
+    use_asset_inventory = input("\nDiscover resources with Cloud Asset Inventory (one search for every selected type)? (y/n) ").lower() == "y"
+    if use_asset_inventory:
+        scope = input("Search a folder or organization instead (folders/ID or organizations/ID, "
+                      "default: the project(s) above): ").strip() or None
 
-    if input(f"\nWould you like to create the import file for {resource_type}? (y/n) ").lower() == "y":
-        create_terraform_import_script(resources, resource_type)
+    # Instances are discovered across all zones; the zone above is the provider default.
+    choose_resource_type(project_ids, creds_file, use_asset_inventory, scope)
 
 def main():
     gcp()
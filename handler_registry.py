@@ -0,0 +1,63 @@
+import importlib
+from typing import Dict, List, NamedTuple, Tuple
+
+# This module must stay cheap to import: it is read at startup to build the
+# menus, before any handler (and its SDKs) is loaded.
+
+
+class ServiceInfo(NamedTuple):
+    """Lightweight description of a service handler."""
+    name: str
+    label: str
+    module: str
+    resource_types: Tuple[str, ...]
+    entry_point: str = "main"
+
+
+SERVICES: Dict[str, ServiceInfo] = {}
+_loaded_modules: Dict[str, object] = {}
+
+
+def register_service(name: str, label: str, module: str, resource_types: Tuple[str, ...],
+                     entry_point: str = "main") -> ServiceInfo:
+    """Register a service handler.  The handler module is not imported until it is used."""
+    info = ServiceInfo(name, label, module, tuple(resource_types), entry_point)
+    SERVICES[name] = info
+    return info
+
+
+def list_services() -> List[ServiceInfo]:
+    """Return the registered services in registration order."""
+    return list(SERVICES.values())
+
+
+def get_service(name: str) -> ServiceInfo:
+    try:
+        return SERVICES[name]
+    except KeyError:
+        raise ValueError(f"Unknown service: {name}")
+
+
+def load_handler(name: str):
+    """Import a service's handler module on first use."""
+    info = get_service(name)
+    if info.module not in _loaded_modules:
+        _loaded_modules[info.module] = importlib.import_module(info.module)
+    return _loaded_modules[info.module]
+
+
+def run_service(name: str) -> None:
+    """Run a service's interactive entry point."""
+    info = get_service(name)
+    getattr(load_handler(name), info.entry_point)()
+
+
+register_service("okta", "Okta", "okta_handler",
+                 ("users", "groups", "applications", "group_memberships", "app_group_assignments"))
+register_service("gcp", "GCP", "gcp_handler",
+                 ("instances", "buckets", "disks", "networks", "subnetworks", "firewalls", "service_accounts",
+                  "custom_roles", "sql_instances", "pubsub_topics", "pubsub_subscriptions"))
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
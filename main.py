@@ -1,6 +1,9 @@
-import importlib
 import os
-import subprocess
+import sys
+from handler_registry import list_services, run_service
+from terraform_plan import check_plan, run_sharded_plan
+from utils import check_terraform_init
+from metrics import METRICS, export_metrics
 
 def clear_screen():
     """Clears the terminal screen."""
@@ -8,16 +11,26 @@ def clear_screen():
 
 def main():
     """Main entry point for the resource import tool."""
+    try:
+        run_interactive()
+    finally:
+        # Written even after an error, so a slow or failed run can still be diagnosed.
+        METRICS.print_summary()
+        export_metrics()
+
+def run_interactive():
+    """Run the interactive menus."""
     print("PLEASE ENSURE YOU HAVE RUN THE REQUIREMENTS FILE: `pip install -r requirements.txt`")
     input("Press Enter to continue...")  
     clear_screen()
 
-    services = {'1': 'okta', '2': 'gcp'}
+    # Menu entries come from the registry's metadata; handler modules (and their SDKs) load only when chosen.
+    services = {str(i + 1): service for i, service in enumerate(list_services())}
 
     while True:
         print("\nChoose a service to import resources from:")
         for key, service in services.items():
-            print(f"{key}. {service.capitalize()}")
+            print(f"{key}. {service.label} ({', '.join(service.resource_types)})")
         print("0. Exit")
 
         choice = input("Enter the number of the service to import (or 0 to exit): ")
@@ -26,45 +39,40 @@ def main():
             print("Exiting resource import tool.")
             break
         elif choice in services:
-            service_name = services[choice]
+            service = services[choice]
             try:
-                handler_module = importlib.import_module(f"{service_name}_handler")
-                handler_module.main()
-            except ImportError:
-                print(f"Error: Could not find or load {service_name}_handler.py")
+                run_service(service.name)
+            except ImportError as e:
+                print(f"Error: Could not load the {service.label} handler ({service.module}.py): {e}")
             except AttributeError:
-                print(f"Error: {service_name}_handler.py does not have a 'main' function.")
+                print(f"Error: {service.module}.py does not have a '{service.entry_point}' function.")
         else:
             print("Invalid choice. Please select a number from the list.")
 
     if input("\nWould you like to create a Terraform plan file for all the resources found? (y/n) ").lower() == 'y':
         try:
-            print("Initialising Terraform...")
-            init_result = subprocess.run(["terraform", "init"], capture_output=True, text=True, check=True)
-            print(init_result.stdout)
-            print("Terraform initialised successfully.")
+            if not check_terraform_init():
+                return
 
+            shards = input("How many plan shards should run in parallel? (default: based on import count) ")
+            max_errors = input("Stop the plan after how many errors? (default: run to completion) ")
+            max_errors = int(max_errors) if max_errors.isdigit() and int(max_errors) > 0 else None
             print("Generating Terraform plan file...")
-            plan_result = subprocess.run(
-                ["terraform", "plan", "-generate-config-out=terraform-importer-created.tf"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            print(plan_result.stdout)
-            print("Terraform plan file created (terraform-importer-created.tf).  Review this file carefully before applying!")
-        except subprocess.CalledProcessError as e:
-            print(f"Error during Terraform plan generation: {e.stderr}")
-
-            with open("terraform_plan_error.log", "w") as log_file:
-                log_file.write(e.stderr)
-            print("Detailed error information has been logged to terraform_plan_error.log")
+            run_sharded_plan(shard_count=int(shards) if shards.isdigit() and int(shards) > 0 else None,
+                             max_errors=max_errors)
+            # Most resource blocks are synthesized from the fetched data; this plan checks them against the provider.
+            if input("\nRun terraform plan over the imports and configuration as a final check? (y/n) ").lower() == 'y':
+                check_plan(max_errors=max_errors)
         except FileNotFoundError:
             print("Error: Terraform is not installed or not in your PATH.")
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Any command line arguments switch to the non-interactive batch mode.
+        import batch
+        sys.exit(batch.main(sys.argv[1:]))
     main()
 
 
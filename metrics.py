@@ -0,0 +1,289 @@
+import json
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Run-wide instrumentation: phase timings, HTTP counters and terraform
+# subprocess durations, exported as a JSON run report and optionally as a
+# Prometheus textfile for the node exporter.  Only the standard library is
+# used, so importing this stays cheap at start-up.
+
+REPORT_FILE = "run_report.json"
+PROMETHEUS_TEXTFILE_ENV = "TERRAFORM_IMPORTER_PROMETHEUS_TEXTFILE"
+METRIC_PREFIX = "terraform_importer"
+# Upper bounds (seconds) of the HTTP latency histogram buckets.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """A cumulative histogram with fixed bucket bounds, as Prometheus expects."""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self) -> Dict:
+        buckets = {str(bound): count for bound, count in zip(self.bounds, self.counts)}
+        buckets["+Inf"] = self.count
+        return {"buckets": buckets, "sum": round(self.sum, 4), "count": self.count}
+
+
+class RunMetrics:
+    """Thread-safe collector for one run of the importer.
+
+    Phase times are summed over every thread that reported them, so a phase
+    run by eight crawl workers can exceed the wall time; `wall_seconds` is the
+    span from the phase's first start to its last end.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.time()
+            self.phases: Dict[str, Dict] = {}
+            self.http: Dict[str, Dict] = {}
+            self.subprocesses: Dict[str, Dict] = {}
+            self.state_filter: Dict[str, Dict] = {}
+
+    def add_phase(self, name: str, seconds: float, started: Optional[float] = None) -> None:
+        """Add time spent in a phase.  `started` is the wall-clock start, if known."""
+        ended = time.time()
+        started = started if started is not None else ended - seconds
+        with self._lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = {"calls": 0, "seconds": 0.0, "first_start": started, "last_end": ended}
+            phase["calls"] += 1
+            phase["seconds"] += seconds
+            phase["first_start"] = min(phase["first_start"], started)
+            phase["last_end"] = max(phase["last_end"], ended)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as one call of a phase."""
+        started_wall, started = time.time(), time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started, started_wall)
+
+    def _endpoint(self, endpoint: str) -> Dict:
+        stats = self.http.get(endpoint)
+        if stats is None:
+            stats = self.http[endpoint] = {"requests": 0, "status": {}, "bytes": 0, "latency": Histogram(),
+                                           "retries": 0, "throttle_waits": 0, "throttle_seconds": 0.0}
+        return stats
+
+    def record_http(self, endpoint: str, status, nbytes: int, seconds: float) -> None:
+        """Count one HTTP request.  `status` is the response code, or "error" if none came back."""
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats["requests"] += 1
+            stats["status"][str(status)] = stats["status"].get(str(status), 0) + 1
+            stats["bytes"] += nbytes
+            stats["latency"].observe(seconds)
+
+    def record_retry(self, endpoint: str) -> None:
+        with self._lock:
+            self._endpoint(endpoint)["retries"] += 1
+
+    def record_throttle(self, endpoint: str, seconds: float) -> None:
+        """Count a wait for rate-limit budget."""
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats["throttle_waits"] += 1
+            stats["throttle_seconds"] += seconds
+
+    def record_state_filter(self, resource_type: str, managed: int, unmanaged: int) -> None:
+        """Count the resources of a type found already managed in state, and those left to import."""
+        with self._lock:
+            counts = self.state_filter.setdefault(resource_type, {"managed": 0, "unmanaged": 0})
+            counts["managed"] += managed
+            counts["unmanaged"] += unmanaged
+
+    def run_subprocess(self, args: List[str], **kwargs) -> subprocess.CompletedProcess:
+        """subprocess.run, timed and counted under its command (e.g. "terraform plan")."""
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = subprocess.run(args, **kwargs)
+            failed = result.returncode != 0
+            return result
+        finally:
+            self.record_subprocess(args, time.perf_counter() - started, failed)
+
+    def record_subprocess(self, args: List[str], seconds: float, failed: bool) -> None:
+        """Count one subprocess run under its command (e.g. "terraform plan")."""
+        command = " ".join(args[:2])
+        with self._lock:
+            stats = self.subprocesses.setdefault(command, {"runs": 0, "failures": 0, "seconds": 0.0,
+                                                           "max_seconds": 0.0})
+            stats["runs"] += 1
+            stats["failures"] += int(failed)
+            stats["seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def report(self) -> Dict:
+        """Return the run report as plain data."""
+        with self._lock:
+            now = time.time()
+            return {
+                "started": self.started,
+                "duration_seconds": round(now - self.started, 3),
+                "phases": {
+                    name: {"calls": phase["calls"], "seconds": round(phase["seconds"], 3),
+                           "wall_seconds": round(phase["last_end"] - phase["first_start"], 3)}
+                    for name, phase in self.phases.items()
+                },
+                "http": {
+                    endpoint: dict(stats, latency=stats["latency"].to_dict(),
+                                   throttle_seconds=round(stats["throttle_seconds"], 3))
+                    for endpoint, stats in self.http.items()
+                },
+                "subprocesses": {
+                    command: dict(stats, seconds=round(stats["seconds"], 3), max_seconds=round(stats["max_seconds"], 3))
+                    for command, stats in self.subprocesses.items()
+                },
+                "state_filter": {resource_type: dict(counts) for resource_type, counts in self.state_filter.items()},
+            }
+
+    def write_report(self, path: str = REPORT_FILE) -> None:
+        """Write the run report as JSON."""
+        _write_atomic(path, json.dumps(self.report(), indent=2))
+
+    def prometheus_text(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        report = self.report()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[Dict, float]]) -> None:
+            full_name = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{full_name}{_labels(labels)} {value}")
+
+        metric("run_duration_seconds", "gauge", "Wall time of the last run.", [({}, report["duration_seconds"])])
+        metric("last_run_timestamp_seconds", "gauge", "When the last run started.", [({}, round(report["started"]))])
+
+        phases = report["phases"]
+        metric("phase_seconds", "gauge", "Time spent in each phase, summed over threads.",
+               [({"phase": name}, phase["seconds"]) for name, phase in phases.items()])
+        metric("phase_wall_seconds", "gauge", "Wall time from the first start to the last end of each phase.",
+               [({"phase": name}, phase["wall_seconds"]) for name, phase in phases.items()])
+
+        http = report["http"]
+        metric("http_requests_total", "counter", "HTTP requests by endpoint and response status.",
+               [({"endpoint": endpoint, "status": status}, count)
+                for endpoint, stats in http.items() for status, count in stats["status"].items()])
+        metric("http_response_bytes_total", "counter", "HTTP response body bytes by endpoint.",
+               [({"endpoint": endpoint}, stats["bytes"]) for endpoint, stats in http.items()])
+        metric("http_retries_total", "counter", "Retried HTTP requests by endpoint.",
+               [({"endpoint": endpoint}, stats["retries"]) for endpoint, stats in http.items()])
+        metric("http_throttle_waits_total", "counter", "Waits for rate-limit budget by endpoint.",
+               [({"endpoint": endpoint}, stats["throttle_waits"]) for endpoint, stats in http.items()])
+        metric("http_throttle_wait_seconds_total", "counter", "Time spent waiting for rate-limit budget.",
+               [({"endpoint": endpoint}, stats["throttle_seconds"]) for endpoint, stats in http.items()])
+        metric("http_request_duration_seconds", "histogram", "HTTP request latency by endpoint.", [])
+        histogram = f"{METRIC_PREFIX}_http_request_duration_seconds"
+        for endpoint, stats in http.items():
+            for bound, count in stats["latency"]["buckets"].items():
+                lines.append(f"{histogram}_bucket{_labels({'endpoint': endpoint, 'le': bound})} {count}")
+            lines.append(f"{histogram}_sum{_labels({'endpoint': endpoint})} {stats['latency']['sum']}")
+            lines.append(f"{histogram}_count{_labels({'endpoint': endpoint})} {stats['latency']['count']}")
+
+        subprocesses = report["subprocesses"]
+        metric("subprocess_runs_total", "counter", "Terraform subprocess runs by command.",
+               [({"command": command}, stats["runs"]) for command, stats in subprocesses.items()])
+        metric("subprocess_failures_total", "counter", "Failed terraform subprocess runs by command.",
+               [({"command": command}, stats["failures"]) for command, stats in subprocesses.items()])
+        metric("subprocess_seconds_total", "counter", "Time spent in terraform subprocesses by command.",
+               [({"command": command}, stats["seconds"]) for command, stats in subprocesses.items()])
+
+        metric("state_filter_resources", "gauge", "Fetched resources already managed in state, or left to import.",
+               [({"resource_type": resource_type, "state": state}, count)
+                for resource_type, counts in report["state_filter"].items() for state, count in counts.items()])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Write a Prometheus textfile.  The write is atomic so the node exporter never reads half a file."""
+        _write_atomic(path, self.prometheus_text())
+
+    def print_summary(self) -> None:
+        """Print where the time went, slowest phase first."""
+        report = self.report()
+        print(f"\nRun finished in {report['duration_seconds']:.1f}s.  Time by phase:")
+        for name, phase in sorted(report["phases"].items(), key=lambda item: item[1]["seconds"], reverse=True):
+            print(f"  {name:<10} {phase['seconds']:9.2f}s over {phase['calls']} call(s), "
+                  f"{phase['wall_seconds']:.2f}s wall")
+        for command, stats in report["subprocesses"].items():
+            print(f"  {command}: {stats['runs']} run(s), {stats['seconds']:.2f}s, {stats['failures']} failed")
+        managed = sum(counts["managed"] for counts in report["state_filter"].values())
+        if managed:
+            unmanaged = sum(counts["unmanaged"] for counts in report["state_filter"].values())
+            print(f"  State: {managed} fetched resources already managed, {unmanaged} to import")
+        requests = sum(stats["requests"] for stats in report["http"].values())
+        if requests:
+            received = sum(stats["bytes"] for stats in report["http"].values())
+            print(f"  HTTP: {requests} requests, {received / 1e6:.1f} MB received")
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _write_atomic(path: str, text: str) -> None:
+    with open(f"{path}.tmp", "w") as f:
+        f.write(text)
+    os.replace(f"{path}.tmp", path)
+
+
+METRICS = RunMetrics()
+phase = METRICS.phase
+add_phase = METRICS.add_phase
+record_http = METRICS.record_http
+record_retry = METRICS.record_retry
+record_throttle = METRICS.record_throttle
+record_state_filter = METRICS.record_state_filter
+run_subprocess = METRICS.run_subprocess
+record_subprocess = METRICS.record_subprocess
+
+
+def export_metrics(report_path: str = REPORT_FILE, prometheus_textfile: Optional[str] = None) -> None:
+    """Write the run report, and the Prometheus textfile if one is given or set in the environment."""
+    prometheus_textfile = prometheus_textfile or os.environ.get(PROMETHEUS_TEXTFILE_ENV)
+    try:
+        METRICS.write_report(report_path)
+        print(f"Run report written to {report_path}")
+        if prometheus_textfile:
+            METRICS.write_prometheus(prometheus_textfile)
+            print(f"Prometheus metrics written to {prometheus_textfile}")
+    except IOError as e:
+        print(f"Could not write run metrics: {e}")
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
@@ -0,0 +1,425 @@
+import queue
+import threading
+import time
+import requests
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Optional, Iterator, Tuple
+from rate_limiter import RateLimitScheduler
+from records import ResourceRecord, DEPENDENT_RECORDS, project_records
+from metrics import add_phase
+from crawl_journal import CrawlJournal
+
+# Largest page size each Okta list endpoint will accept.
+OKTA_PAGE_LIMITS = {
+    "users": 200,
+    "groups": 10000,
+    "apps": 200,
+}
+
+# Resource types crawled with one sub-listing per parent record:
+# type -> (parent resource type, sub-collection under /{parent}/{id}/, page limit).
+OKTA_CHILD_RESOURCES = {
+    "group_memberships": ("groups", "users", 1000),
+    "app_group_assignments": ("applications", "groups", 200),
+}
+# Okta manages the members of built-in groups (e.g. Everyone) itself.
+SKIP_MEMBERSHIPS_FOR_GROUP_TYPES = ("BUILT_IN",)
+
+# Disjoint slices that together cover the default listing of each endpoint.
+# Users exclude DEPROVISIONED because the plain /users listing does too.
+OKTA_PARTITIONS = {
+    "users": [
+        {"search": f'status eq "{status}"'}
+        for status in ("STAGED", "PROVISIONED", "ACTIVE", "RECOVERY",
+                       "PASSWORD_EXPIRED", "LOCKED_OUT", "SUSPENDED")
+    ],
+    "groups": [
+        {"search": f'type eq "{group_type}"'}
+        for group_type in ("OKTA_GROUP", "APP_GROUP", "BUILT_IN")
+    ],
+    "apps": [
+        {"filter": f'status eq "{status}"'}
+        for status in ("ACTIVE", "INACTIVE")
+    ],
+}
+
+# Endpoints that can be filtered on lastUpdated, and the query parameter that does it.
+# Apps have no such filter, so they are always crawled in full.
+OKTA_DELTA_PARAMS = {
+    "users": "filter",
+    "groups": "filter",
+}
+OKTA_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+# Re-read a little before the watermark so records updated mid-crawl are not missed.
+DELTA_OVERLAP = timedelta(minutes=10)
+
+DEFAULT_MAX_WORKERS = 8
+REQUEST_TIMEOUT = 60
+# Pages buffered between the crawl workers and the consumer; bounds streaming memory.
+DEFAULT_QUEUE_SIZE = 16
+# Concurrent per-parent sub-crawls.  They share the main crawl's rate-limit scheduler.
+DEFAULT_FAN_OUT_WORKERS = 8
+
+_DONE = object()
+
+
+def okta_endpoint(resource_type: str) -> str:
+    """Map a resource type name to its Okta API collection name."""
+    return "apps" if resource_type == "applications" else resource_type
+
+
+def okta_base_url(org_name: str, base_url: str) -> str:
+    """Build the Okta org URL.  A base URL with a scheme is used as-is."""
+    if base_url.startswith(("http://", "https://")):
+        return base_url.rstrip("/")
+    return f"https://{org_name}.{base_url}"
+
+
+def create_okta_session(api_token: str, pool_size: int = DEFAULT_MAX_WORKERS) -> requests.Session:
+    """Create a Session with a connection pool large enough for concurrent crawls."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "Authorization": f"SSWS {api_token}"
+    })
+    return session
+
+
+def date_range_partitions(start: str, end: str, count: int) -> List[Dict]:
+    """Split users into `count` slices by `created` date between two ISO dates (YYYY-MM-DD).
+
+    Two more slices take the users created before `start` and from `end` on,
+    so together the slices still cover every user.
+    """
+    first, last = date.fromisoformat(start), date.fromisoformat(end)
+    step = timedelta(days=max(1, ((last - first).days + count - 1) // count))
+    edges = [first]
+    while edges[-1] + step < last:
+        edges.append(edges[-1] + step)
+    if last > first:
+        edges.append(last)
+    stamps = [f'"{edge.isoformat()}T00:00:00.000Z"' for edge in edges]
+    searches = ([f"created lt {stamps[0]}"] +
+                [f"created ge {lower} and created lt {upper}" for lower, upper in zip(stamps, stamps[1:])] +
+                [f"created ge {stamps[-1]}"])
+    return [{"search": search} for search in searches]
+
+
+def delta_partition(resource_type: str, watermark: Optional[str]) -> Optional[Dict]:
+    """Return the query that fetches records changed since `watermark`, or None if unsupported."""
+    param = OKTA_DELTA_PARAMS.get(okta_endpoint(resource_type))
+    if not param or not watermark:
+        return None
+    since = datetime.strptime(watermark, OKTA_TIME_FORMAT) - DELTA_OVERLAP
+    return {param: f'lastUpdated gt "{since.strftime(OKTA_TIME_FORMAT[:-1])[:-3]}Z"'}
+
+
+def iter_okta_page_links(session: requests.Session, url: str, params: Optional[Dict] = None,
+                         scheduler: Optional[RateLimitScheduler] = None) -> Iterator[Tuple[List[Dict], Optional[str]]]:
+    """Yield (page, next page URL) for a paginated Okta listing, following the Link: rel="next" chain."""
+    scheduler = scheduler or RateLimitScheduler()
+    while url:
+        response = scheduler.get(session, url, params=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        # The next link already carries the cursor and the original query string.
+        next_url = response.links.get("next", {}).get("url")
+        yield response.json(), next_url
+        url, params = next_url, None
+
+
+def iter_okta_pages(session: requests.Session, url: str, params: Optional[Dict] = None,
+                    scheduler: Optional[RateLimitScheduler] = None) -> Iterator[List[Dict]]:
+    """Yield each page of a paginated Okta listing, following the Link: rel="next" chain."""
+    for page, _ in iter_okta_page_links(session, url, params, scheduler):
+        yield page
+
+
+def okta_collection_url(org_name: str, base_url: str, resource_type: str) -> str:
+    """Return the list URL for an Okta resource type."""
+    return f"{okta_base_url(org_name, base_url)}/api/v1/{okta_endpoint(resource_type)}"
+
+
+def iter_okta_partition(session: requests.Session, org_name: str, base_url: str,
+                        resource_type: str, partition: Optional[Dict] = None,
+                        scheduler: Optional[RateLimitScheduler] = None,
+                        resume_url: Optional[str] = None) -> Iterator[Tuple[List[Dict], Optional[str]]]:
+    """Yield (page, next page URL) for one resource type, optionally restricted to a single partition.
+
+    `resume_url` continues from a checkpointed next-page URL instead of the first page.
+    """
+    if resume_url:
+        return iter_okta_page_links(session, resume_url, None, scheduler)
+    params = {"limit": OKTA_PAGE_LIMITS.get(okta_endpoint(resource_type), 200)}
+    params.update(partition or {})
+    return iter_okta_page_links(session, okta_collection_url(org_name, base_url, resource_type), params, scheduler)
+
+
+def _crawl_jobs(resource_types: List[str], partitions: Dict[str, List[Dict]]) -> List[Tuple[str, Optional[Dict]]]:
+    """Expand resource types into (resource_type, partition) crawl jobs."""
+    jobs = []
+    for resource_type in resource_types:
+        for partition in partitions.get(okta_endpoint(resource_type)) or [None]:
+            jobs.append((resource_type, partition))
+    return jobs
+
+
+def stream_okta_pages(org_name: str, api_token: str, base_url: str, resource_types: List[str],
+                      partitioned: bool = False, max_workers: int = DEFAULT_MAX_WORKERS,
+                      partitions: Optional[Dict[str, List[Dict]]] = None,
+                      queue_size: int = DEFAULT_QUEUE_SIZE,
+                      scheduler: Optional[RateLimitScheduler] = None,
+                      project: bool = False,
+                      journal: Optional[CrawlJournal] = None) -> Iterator[Tuple[str, List]]:
+    """Crawl several Okta resource types concurrently, yielding (resource_type, page) as pages arrive.
+
+    Pages pass through a bounded queue, so at most `queue_size` pages are held
+    in memory no matter how large the org is.  With `partitioned`, each type is
+    split into the slices from OKTA_PARTITIONS (or `partitions`, if given).
+    Slices are disjoint, so no page is yielded twice.  All workers share one
+    RateLimitScheduler, so together they stay within each endpoint's budget.
+    With `project`, workers turn each page into ResourceRecords before queueing
+    it, so the full API objects are dropped as soon as they are parsed.
+    With a `journal`, every page is checkpointed as it arrives; jobs with a
+    checkpoint replay their journaled pages and resume from the saved cursor.
+    """
+    partitions = partitions or (OKTA_PARTITIONS if partitioned else {})
+    jobs = _crawl_jobs(resource_types, partitions)
+    scheduler = scheduler or RateLimitScheduler()
+    session = create_okta_session(api_token, pool_size=max_workers)
+    pages = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker(resource_type: str, partition: Optional[Dict]) -> None:
+        job = journal.job(resource_type, partition) if journal else None
+        try:
+            resume_url = None
+            if job and job.load():
+                print(f"Resuming {resource_type} from a checkpoint: {job.state['items']} already fetched "
+                      f"in {job.state['pages']} page(s)")
+                for items in job.replay():
+                    if not put((resource_type, [ResourceRecord.from_dict(item) for item in items] if project else items)):
+                        return
+                if job.state["complete"]:
+                    return
+                resume_url = job.state["next_url"]
+
+            pages_iter = iter_okta_partition(session, org_name, base_url, resource_type, partition, scheduler,
+                                             resume_url)
+            while True:
+                started = time.perf_counter()
+                page, next_url = next(pages_iter, (None, None))
+                fetched = time.perf_counter()
+                add_phase("fetch", fetched - started)
+                if page is None:
+                    break
+                if project:
+                    page = list(project_records(page, resource_type))
+                    add_phase("transform", time.perf_counter() - fetched)
+                if job:
+                    job.append([record.to_dict() for record in page] if project else page, next_url)
+                if not put((resource_type, page)):
+                    return
+        except Exception as e:
+            put((resource_type, e))
+        finally:
+            if job:
+                job.close()
+            put((resource_type, _DONE))
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for resource_type, partition in jobs:
+            executor.submit(worker, resource_type, partition)
+
+        remaining = len(jobs)
+        while remaining:
+            resource_type, page = pages.get()
+            if page is _DONE:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield resource_type, page
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+        session.close()
+
+
+def okta_crawl_types(resource_types: List[str]) -> List[str]:
+    """Return the collections that must be listed for the requested types, including parents of dependent types."""
+    crawl_types = [resource_type for resource_type in resource_types if resource_type not in OKTA_CHILD_RESOURCES]
+    for resource_type in resource_types:
+        parent_type = OKTA_CHILD_RESOURCES.get(resource_type, (None,))[0]
+        if parent_type and parent_type not in crawl_types:
+            crawl_types.append(parent_type)
+    return crawl_types
+
+
+def okta_crawl_units(resource_types: List[str]) -> List[List[str]]:
+    """Group resource types that must be crawled together: each dependent type joins its parent's unit.
+
+    Crawling a unit lists each collection once, so concurrent crawls of one org never list the same parent twice.
+    """
+    units: Dict[str, List[str]] = {}
+    for resource_type in resource_types:
+        key = OKTA_CHILD_RESOURCES.get(resource_type, (resource_type,))[0]
+        units.setdefault(key, []).append(resource_type)
+    return list(units.values())
+
+
+class OktaFanOut:
+    """Run one paginated sub-crawl per parent record (e.g. the members of each group) on a bounded thread pool.
+
+    At most `max_workers` sub-crawls run at once and at most twice that many
+    wait in the pool, so submit() blocks instead of queueing thousands of
+    parents.  Every request goes through the caller's RateLimitScheduler,
+    so the fan-out shares one budget with the main crawl.
+    """
+
+    def __init__(self, org_name: str, api_token: str, base_url: str, scheduler: RateLimitScheduler,
+                 max_workers: int = DEFAULT_FAN_OUT_WORKERS):
+        self.org_name = org_name
+        self.base_url = base_url
+        self.scheduler = scheduler
+        self.max_pending = max_workers * 2
+        self.session = create_okta_session(api_token, pool_size=max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = set()
+        self.finished = []
+
+    def _crawl(self, resource_type: str, parent: ResourceRecord) -> Tuple[str, Optional[ResourceRecord]]:
+        parent_type, sub_collection, limit = OKTA_CHILD_RESOURCES[resource_type]
+        url = f"{okta_collection_url(self.org_name, self.base_url, parent_type)}/{parent.id}/{sub_collection}"
+        started = time.perf_counter()
+        try:
+            child_ids = [item["id"] for page in iter_okta_pages(self.session, url, {"limit": limit}, self.scheduler)
+                         for item in page]
+        except requests.HTTPError as e:
+            # The parent was deleted after it was listed.
+            if e.response is not None and e.response.status_code == 404:
+                return resource_type, None
+            raise
+        finally:
+            add_phase("fetch", time.perf_counter() - started)
+        # Nothing to import for a parent without children.
+        return resource_type, DEPENDENT_RECORDS[resource_type](parent, child_ids) if child_ids else None
+
+    def submit(self, resource_type: str, parent: ResourceRecord) -> None:
+        """Queue the sub-crawl of one parent, waiting while the pool is full."""
+        while len(self.pending) >= self.max_pending:
+            done, self.pending = wait_futures(self.pending, return_when=FIRST_COMPLETED)
+            self.finished.extend(done)
+        self.pending.add(self.executor.submit(self._crawl, resource_type, parent))
+
+    def completed(self, wait: bool = False) -> Iterator[Tuple[str, List[ResourceRecord]]]:
+        """Yield (resource_type, records) for the sub-crawls finished so far, or for all of them with `wait`."""
+        if wait:
+            done, self.pending = self.pending, set()
+            wait_futures(done)
+        else:
+            done = {future for future in self.pending if future.done()}
+            self.pending -= done
+        finished, self.finished = self.finished + list(done), []
+
+        pages: Dict[str, List[ResourceRecord]] = {}
+        for future in finished:
+            resource_type, record = future.result()
+            if record is not None:
+                pages.setdefault(resource_type, []).append(record)
+        yield from pages.items()
+
+    def close(self) -> None:
+        for future in self.pending:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+
+def stream_okta_resources(org_name: str, api_token: str, base_url: str, resource_types: List[str],
+                          partitioned: bool = False, max_workers: int = DEFAULT_MAX_WORKERS,
+                          partitions: Optional[Dict[str, List[Dict]]] = None,
+                          scheduler: Optional[RateLimitScheduler] = None,
+                          journal: Optional[CrawlJournal] = None,
+                          fan_out_workers: int = DEFAULT_FAN_OUT_WORKERS) -> Iterator[Tuple[str, List[ResourceRecord]]]:
+    """Yield (resource_type, records) for every requested type, dependent types included, in one pass.
+
+    Collections are crawled with stream_okta_pages.  As pages of a parent type
+    (groups, applications) arrive, the sub-crawls for its dependent types are
+    handed to an OktaFanOut, so memberships are fetched while the parents are
+    still being listed.  Parents that were not requested themselves are
+    listed but not yielded.  Only the parent listings are journaled; on
+    resume their sub-crawls run again.
+    """
+    scheduler = scheduler or RateLimitScheduler()
+    dependent_types = [resource_type for resource_type in resource_types if resource_type in OKTA_CHILD_RESOURCES]
+    pages = stream_okta_pages(org_name, api_token, base_url, okta_crawl_types(resource_types),
+                              partitioned=partitioned, max_workers=max_workers, partitions=partitions,
+                              scheduler=scheduler, project=True, journal=journal)
+    if not dependent_types:
+        yield from pages
+        return
+
+    fan_out = OktaFanOut(org_name, api_token, base_url, scheduler, fan_out_workers)
+    try:
+        for resource_type, page in pages:
+            if resource_type in resource_types:
+                yield resource_type, page
+            for dependent_type in dependent_types:
+                if OKTA_CHILD_RESOURCES[dependent_type][0] != resource_type:
+                    continue
+                for parent in page:
+                    if dependent_type == "group_memberships" and parent.attr("type") in SKIP_MEMBERSHIPS_FOR_GROUP_TYPES:
+                        continue
+                    fan_out.submit(dependent_type, parent)
+            yield from fan_out.completed()
+        yield from fan_out.completed(wait=True)
+    finally:
+        # Closing the page stream stops its workers; left open, a fan-out error would strand them in put().
+        try:
+            pages.close()
+        finally:
+            fan_out.close()
+
+
+def crawl_okta_org(org_name: str, api_token: str, base_url: str, resource_types: List[str],
+                   partitioned: bool = False, max_workers: int = DEFAULT_MAX_WORKERS,
+                   partitions: Optional[Dict[str, List[Dict]]] = None,
+                   scheduler: Optional[RateLimitScheduler] = None,
+                   journal: Optional[CrawlJournal] = None) -> Dict[str, List[ResourceRecord]]:
+    """Crawl several Okta resource types concurrently and return every record, grouped by type.
+
+    With a `journal`, an interrupted crawl resumes from its last checkpoint
+    the next time it runs; the journal is cleared once the crawl completes.
+    """
+    results = {resource_type: {} for resource_type in resource_types}
+    for resource_type, page in stream_okta_resources(org_name, api_token, base_url, resource_types,
+                                                     partitioned=partitioned, max_workers=max_workers,
+                                                     partitions=partitions, scheduler=scheduler, journal=journal):
+        merged = results[resource_type]
+        for record in page:
+            # Slices are disjoint, but keying on id keeps the merge safe if they overlap.
+            merged.setdefault(record.id, record)
+
+    if journal:
+        journal.clear(okta_crawl_types(resource_types))
+    return {resource_type: list(merged.values()) for resource_type, merged in results.items()}
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
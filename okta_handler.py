@@ -1,68 +1,218 @@
 import json
 import os
 import getpass
-import requests
-import random
-import glob
-from typing import List, Dict, Optional
-from terraform_utils import create_terraform_config, create_terraform_import_script, handle_duplicate_imports
-from utils import sanitize_name, check_terraform_init
+import threading
+import time
+from typing import List, Dict, Optional, Iterable
+from terraform_utils import (create_terraform_config, create_terraform_import_script,
+                             ImportScriptWriter, resolve_provider_versions, provider_version_exists)
+from utils import check_terraform_init
+from okta_crawler import (crawl_okta_org, stream_okta_pages, stream_okta_resources, okta_crawl_types, okta_base_url,
+                          okta_endpoint, delta_partition)
+from rate_limiter import RateLimitScheduler
+from handler_registry import get_service
+from records import ResourceRecord
+from metrics import phase, add_phase
+from crawl_journal import CrawlJournal
+from snapshots import SnapshotWriter, iter_snapshot, snapshot_file, snapshot_ids, write_snapshot
+
+WATERMARK_FILE = 'okta_watermarks.json'
+
+_watermark_lock = threading.Lock()
 
 
 def get_latest_okta_provider_version() -> str:
     """Fetch the latest Okta provider version from the Terraform registry."""
-    url = "https://registry.terraform.io/v1/providers/okta/okta"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        return data['version']
-    except requests.RequestException as e:
-        print(f"Failed to fetch the latest Okta provider version: {e}")
-        return "~> 4.0"
+    # Resolve google alongside okta: create_terraform_config needs both and reuses the cached result.
+    return resolve_provider_versions(["okta", "google"])["okta"]
 
 def check_provider_availability(provider_version: str, latest_version: str) -> None:
     """Check if the specified Okta provider version is available."""
-    url = f"https://registry.terraform.io/v1/providers/okta/okta/{provider_version}"
-    try:
-        response = requests.get(url)
-        if response.status_code == 404:
-            print(f"\nWARNING: The specified Okta provider version '{provider_version}' is not available.")
-            print("This may cause Terraform to fail when initializing.")
-            print("Consider using a different version or check your internet connection.")
-            print(f"The Latest version is {latest_version}. Other available versions can be found at: "
-                  "https://registry.terraform.io/providers/okta/okta/versions")
-    except requests.RequestException:
+    available = provider_version_exists("okta", provider_version)
+    if available is None:
         print("\nWARNING: Unable to verify Okta provider version availability.")
         print("Please ensure you have an active internet connection.")
+    elif not available:
+        print(f"\nWARNING: The specified Okta provider version '{provider_version}' is not available.")
+        print("This may cause Terraform to fail when initializing.")
+        print("Consider using a different version or check your internet connection.")
+        print(f"The Latest version is {latest_version}. Other available versions can be found at: "
+              "https://registry.terraform.io/providers/okta/okta/versions")
+
+
+def get_okta_resources(org_name: str, api_token: str, base_url: str, resource_type: str,
+                       partitioned: bool = False, scheduler: Optional[RateLimitScheduler] = None,
+                       output_dir: str = '.') -> List[ResourceRecord]:
+    """Retrieve one Okta resource type (users, groups, applications or a dependent type) as ResourceRecords.
+
+    The crawl is checkpointed under output_dir, so if it fails part way a rerun resumes from the last page.
+    """
+    journal = CrawlJournal(okta_base_url(org_name, base_url), output_dir)
+    return crawl_okta_org(org_name, api_token, base_url, [resource_type], partitioned=partitioned,
+                          scheduler=scheduler, journal=journal)[resource_type]
+
+def stream_okta_import(org_name: str, api_token: str, base_url: str, resource_types: List[str],
+                       partitioned: bool = False, scheduler: Optional[RateLimitScheduler] = None,
+                       output_dir: str = '.', partitions: Optional[Dict[str, List[Dict]]] = None) -> Dict[str, str]:
+    """Stream Okta pages straight into NDJSON snapshots and import scripts in a single pass.
+
+    Each page is projected into records, written to okta_{type}.ndjson.gz and
+    turned into import blocks as it arrives, then dropped, so memory stays
+    flat regardless of org size.  Dependent types (group memberships, app
+    group assignments) are fetched by a fan-out while their parents are
+    listed.  Pages are checkpointed as they arrive, so an interrupted run
+    picks up where it stopped the next time; until then the previous import
+    files are left as they were.  `partitions` replaces the default slices
+    of a partitioned crawl (see okta_crawler.stream_okta_resources).
+    Returns the import file created for each resource type.
+    """
+    writers = {resource_type: ImportScriptWriter(resource_type, verbose=False, output_dir=output_dir)
+               for resource_type in resource_types}
+    snapshots = {resource_type: SnapshotWriter(snapshot_path(resource_type, output_dir), resource_type)
+                 for resource_type in resource_types}
+    watermarks = {resource_type: None for resource_type in resource_types}
+    import_files = {}
+    completed = False
+    journal = CrawlJournal(okta_base_url(org_name, base_url), output_dir)
+    try:
+        for resource_type, page in stream_okta_resources(org_name, api_token, base_url, resource_types,
+                                                         partitioned=partitioned, partitions=partitions,
+                                                         scheduler=scheduler, journal=journal):
+            started = time.perf_counter()
+            snapshots[resource_type].write(page)
+            for record in page:
+                writers[resource_type].write(record)
+            add_phase("write", time.perf_counter() - started)
+            watermarks[resource_type] = max_last_updated(page, watermarks[resource_type])
+        completed = True
+    finally:
+        for snapshot in snapshots.values():
+            if completed:
+                snapshot.close()
+            else:
+                snapshot.discard()
+        for resource_type, writer in writers.items():
+            if not completed:
+                writer.discard()
+                continue
+            import_files[resource_type] = writer.close()
+            print(f"Total {resource_type} streamed: {writer.count} (snapshot: {snapshot_path(resource_type, output_dir)})")
+
+    # Only a complete snapshot is a safe base for later incremental runs.
+    if completed:
+        save_watermarks(org_name, base_url, watermarks, output_dir)
+        journal.clear(okta_crawl_types(resource_types))
+    return import_files
+
+def snapshot_path(resource_type: str, output_dir: str = '.') -> str:
+    """Return the snapshot file for a resource type."""
+    return snapshot_file('okta', resource_type, output_dir)
+
+def max_last_updated(records: Iterable[ResourceRecord], watermark: Optional[str] = None) -> Optional[str]:
+    """Return the newest lastUpdated among the records and the current watermark."""
+    # Okta timestamps share one fixed-width format, so they order correctly as strings.
+    for record in records:
+        last_updated = record.updated
+        if last_updated and (watermark is None or last_updated > watermark):
+            watermark = last_updated
+    return watermark
+
+def load_watermarks(org_name: str, base_url: str, output_dir: str = '.') -> Dict[str, str]:
+    """Load the per-resource-type lastUpdated high-water marks stored for an org."""
+    try:
+        with open(os.path.join(output_dir, WATERMARK_FILE), 'r') as f:
+            return json.load(f).get(okta_base_url(org_name, base_url), {})
+    except (IOError, ValueError):
+        return {}
+
+def save_watermarks(org_name: str, base_url: str, watermarks: Dict[str, Optional[str]], output_dir: str = '.') -> None:
+    """Store high-water marks for an org, keeping those of other orgs and resource types."""
+    watermark_file = os.path.join(output_dir, WATERMARK_FILE)
+    with _watermark_lock:
+        try:
+            with open(watermark_file, 'r') as f:
+                stored = json.load(f)
+        except (IOError, ValueError):
+            stored = {}
+        org_marks = stored.setdefault(okta_base_url(org_name, base_url), {})
+        org_marks.update({resource_type: mark for resource_type, mark in watermarks.items() if mark})
+        with open(f'{watermark_file}.tmp', 'w') as f:
+            json.dump(stored, f, indent=2)
+        os.replace(f'{watermark_file}.tmp', watermark_file)
+
+def merge_into_snapshot(snapshot_path: str, resource_type: str,
+                        changed: Dict[str, ResourceRecord]) -> List[ResourceRecord]:
+    """Replace changed records in a snapshot and append new ones.  Returns the new records."""
+    # The snapshot's ID index says which records are new without decompressing it first.
+    known = snapshot_ids(snapshot_path)
+    new_records = [record for record_id, record in changed.items() if record_id not in known]
+    writer = SnapshotWriter(snapshot_path, resource_type)
+    try:
+        writer.write(changed.get(record.id, record) for record in iter_snapshot(snapshot_path))
+        writer.write(new_records)
+    except BaseException:
+        writer.discard()
+        raise
+    writer.close()
+    return new_records
+
+def incremental_okta_import(org_name: str, api_token: str, base_url: str, resource_types: List[str],
+                            scheduler: Optional[RateLimitScheduler] = None,
+                            output_dir: str = '.') -> Dict[str, Optional[str]]:
+    """Fetch only records changed since the last run and merge them into the previous snapshots.
 
+    When a type has new or updated records, its import file and generated
+    config are rewritten from the merged snapshot: earlier blocks keep their
+    addresses, new records are added and updated ones re-rendered.  Only the
+    fetch scales with the delta.  The rewrite is a local pass over the whole
+    snapshot, so the files stay sorted and identical to a full crawl's.  Plan
+    shards are split by address hash, so while the shard count is unchanged,
+    only the shards holding new blocks are planned again.  Resource types with
+    no snapshot, no watermark or no lastUpdated filter fall back to a full
+    streaming import.
+    """
+    watermarks = load_watermarks(org_name, base_url, output_dir)
+    partitions = {}
+    for resource_type in resource_types:
+        partition = delta_partition(resource_type, watermarks.get(resource_type))
+        if partition and os.path.exists(snapshot_path(resource_type, output_dir)):
+            partitions[okta_endpoint(resource_type)] = [partition]
 
-def get_okta_resources(org_name: str, api_token: str, base_url: str, resource_type: str) -> List[Dict]:
-    """Retrieve resources (users/groups) from Okta."""
-    resources = []
-    if resource_type == "applications":
-        url = f"https://{org_name}.{base_url}/api/v1/apps"
-    else:
-        url = f"https://{org_name}.{base_url}/api/v1/{resource_type}"
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "Authorization": f"SSWS {api_token}"
-    }
+    delta_types = [resource_type for resource_type in resource_types if okta_endpoint(resource_type) in partitions]
+    full_types = [resource_type for resource_type in resource_types if resource_type not in delta_types]
 
-    while url:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        resources.extend(response.json())
+    import_files = {}
+    if full_types:
+        print(f"No usable watermark for {', '.join(full_types)}; running a full crawl.")
+        import_files.update(stream_okta_import(org_name, api_token, base_url, full_types, scheduler=scheduler,
+                                               output_dir=output_dir))
+    if not delta_types:
+        return import_files
 
-        links = response.headers.get('Link')
-        url = next((link.split(';')[0].strip('<>') for link in links.split(',') if 'rel="next"' in link), None) if links else None
+    changed = {resource_type: {} for resource_type in delta_types}
+    for resource_type, page in stream_okta_pages(org_name, api_token, base_url, delta_types,
+                                                 partitions=partitions, scheduler=scheduler, project=True):
+        for record in page:
+            changed[resource_type][record.id] = record
 
-    return resources
+    new_watermarks = {}
+    for resource_type in delta_types:
+        with phase("write"):
+            new_records = merge_into_snapshot(snapshot_path(resource_type, output_dir), resource_type,
+                                              changed[resource_type])
+        print(f"{resource_type}: {len(changed[resource_type])} changed, {len(new_records)} new since "
+              f"{watermarks[resource_type]}")
+        new_watermarks[resource_type] = max_last_updated(changed[resource_type].values(), watermarks[resource_type])
+        snapshot = iter_snapshot(snapshot_path(resource_type, output_dir))
+        import_files[resource_type] = (create_terraform_import_script(snapshot, resource_type, verbose=False,
+                                                                      output_dir=output_dir)
+                                       if changed[resource_type] else None)
+    save_watermarks(org_name, base_url, new_watermarks, output_dir)
+    return import_files
 
 def main() -> None:
     """Main function to run the Okta resource import."""
-    resource_types = ['users', 'groups']  # Removed applications for now
+    resource_types = list(get_service('okta').resource_types)
 
     latest_version = get_latest_okta_provider_version()
     print(f"Latest Okta provider version: {latest_version}")
@@ -91,6 +241,7 @@ def main() -> None:
         print("\nAvailable Okta resources to import:")
         for i, resource_type in enumerate(resource_types):
             print(f"{i + 1}. {resource_type}")
+        print("A. All of the above (fetched concurrently)")
         print("0. Exit")
 
         choice = input("Enter the number of the resource to import (or 0 to exit): ")
@@ -100,35 +251,55 @@ def main() -> None:
             break
 
         try:
-            index = int(choice) - 1
-            if 0 <= index < len(resource_types):
-                selected_resource_type = resource_types[index]
-                if input(f"\nWould you like to import all {selected_resource_type} from Okta? (y/n) ").lower() == "y":
-                    resources = get_okta_resources(org_name, api_key, base_url, selected_resource_type)
-                    print(f"Total {selected_resource_type} retrieved: {len(resources)}")
-
-                    if resources:
-                        if input(f"\nWould you like to save the imported {selected_resource_type} to a file? (y/n) ").lower() == "y":
-                            with open(f'okta_{selected_resource_type}.json', 'w') as f:
-                                json.dump(resources, f, indent=2)
-
-                        if input(f"\nWould you like to create the import file for {selected_resource_type}? (y/n) ").lower() == 'y':
-                            import_file = create_terraform_import_script(resources, selected_resource_type)
-                            if import_file:
-                                print(f"Terraform import script created: {import_file}")
-                                if input("\nWould you like to handle duplicate imports in this file? (y/n) ").lower() == 'y':
-                                    handle_duplicate_imports(import_file)
-                    else:
-                        print(f"No {selected_resource_type} found in the Okta organization.")
+            if choice.lower() == 'a':
+                selected_resource_types = resource_types
             else:
-                print("Invalid choice. Please select a number from the list.")
+                index = int(choice) - 1
+                if not 0 <= index < len(resource_types):
+                    print("Invalid choice. Please select a number from the list.")
+                    continue
+                selected_resource_types = [resource_types[index]]
         except ValueError:
             print("Invalid input. Please enter a number.")
-    
-    # Handle duplicate imports in generated files
-    if input("\nWould you like to handle duplicate imports in *all* generated files? (y/n) ").lower() == 'y':
-        for file_path in glob.glob("output_file_*.tf"):
-            handle_duplicate_imports(file_path)
+            continue
+
+        if input(f"\nWould you like to import all {', '.join(selected_resource_types)} from Okta? (y/n) ").lower() != "y":
+            continue
+        partitioned = input("Split large resource types into parallel slices? (y/n) ").lower() == "y"
+
+        scheduler = RateLimitScheduler()
+
+        if (load_watermarks(org_name, base_url)
+                and input("Only fetch changes since the last streamed run (incremental; the import files are "
+                          "still rewritten locally from the snapshots)? (y/n) ").lower() == "y"):
+            incremental_okta_import(org_name, api_key, base_url, selected_resource_types, scheduler=scheduler)
+            scheduler.print_report()
+            continue
+
+        if input("Stream straight to NDJSON snapshots and import files (low memory)? (y/n) ").lower() == "y":
+            stream_okta_import(org_name, api_key, base_url, selected_resource_types, partitioned=partitioned,
+                               scheduler=scheduler)
+            scheduler.print_report()
+            continue
+
+        fetched = crawl_okta_org(org_name, api_key, base_url, selected_resource_types, partitioned=partitioned,
+                                 scheduler=scheduler, journal=CrawlJournal(okta_base_url(org_name, base_url)))
+        scheduler.print_report()
+
+        for selected_resource_type in selected_resource_types:
+            resources = fetched[selected_resource_type]
+            print(f"Total {selected_resource_type} retrieved: {len(resources)}")
+
+            if resources:
+                if input(f"\nWould you like to save the imported {selected_resource_type} to a file? (y/n) ").lower() == "y":
+                    write_snapshot(snapshot_path(selected_resource_type), selected_resource_type, resources)
+
+                if input(f"\nWould you like to create the import file for {selected_resource_type}? (y/n) ").lower() == 'y':
+                    import_file = create_terraform_import_script(resources, selected_resource_type)
+                    if import_file:
+                        print(f"Terraform import script created: {import_file}")
+            else:
+                print(f"No {selected_resource_type} found in the Okta organization.")
 
 #Example use
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+import random
+import re
+import threading
+import time
+import requests
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from metrics import record_http, record_retry, record_throttle
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Path segments that look like Okta object ids (e.g. 00u1ab2cd3EF4gh5i6j7) share one bucket.
+_ID_SEGMENT = re.compile(r'^(?=.*\d)[A-Za-z0-9]{15,}$')
+
+
+def bucket_key(url: str) -> str:
+    """Return the rate-limit bucket for a URL: its path, with object ids collapsed."""
+    segments = urlparse(url).path.rstrip('/').split('/')
+    return '/'.join('{id}' if _ID_SEGMENT.match(segment) else segment for segment in segments)
+
+
+class RateLimitBucket:
+    """The last known state of one Okta rate-limit bucket."""
+
+    __slots__ = ('metered', 'limit', 'remaining', 'reset', 'in_flight', 'requests', 'windows', 'unused',
+                 'throttle_waits', 'throttle_seconds', 'retries')
+
+    def __init__(self):
+        self.metered = None
+        self.limit = None
+        self.remaining = None
+        self.reset = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.windows = 0
+        self.unused = 0
+        self.throttle_waits = 0
+        self.throttle_seconds = 0.0
+        self.retries = 0
+
+
+class RateLimitScheduler:
+    """Pace concurrent requests against Okta's per-endpoint rate limits.
+
+    Every response's X-Rate-Limit-* headers update the bucket for its endpoint.
+    A request is only let through while the bucket has budget left after the
+    requests already in flight; otherwise the caller waits for the window to
+    reset.  429 and 5xx responses are retried, waiting for the reset time (429)
+    or backing off exponentially (5xx).
+    """
+
+    def __init__(self, reserve: int = 0, max_retries: int = 6, backoff: float = 1.0, max_backoff: float = 60.0):
+        self.reserve = reserve
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.buckets: Dict[str, RateLimitBucket] = {}
+        self._lock = threading.Condition()
+
+    def _bucket(self, key: str) -> RateLimitBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = RateLimitBucket()
+        return bucket
+
+    def acquire(self, key: str) -> None:
+        """Block until the bucket has budget for one more request, then claim it.
+
+        Only a wait on a metered bucket that is out of budget counts as a
+        throttle, once however many wakeups it takes; waiting for a new
+        bucket's first probe to answer does not.
+        """
+        with self._lock:
+            bucket = self._bucket(key)
+            throttled_at = None
+            while True:
+                now = time.time()
+                if bucket.metered is None:
+                    # Nothing learned yet: let a single probe through to read the headers.
+                    budget = 1 - bucket.in_flight
+                elif not bucket.metered:
+                    budget = 1
+                elif now >= bucket.reset:
+                    budget = bucket.limit - self.reserve - bucket.in_flight
+                else:
+                    budget = bucket.remaining - self.reserve - bucket.in_flight
+                if budget > 0:
+                    bucket.in_flight += 1
+                    bucket.requests += 1
+                    if throttled_at is not None:
+                        waited = time.time() - throttled_at
+                        bucket.throttle_waits += 1
+                        bucket.throttle_seconds += waited
+                        record_throttle(key, waited)
+                    return
+
+                if bucket.metered and throttled_at is None:
+                    throttled_at = now
+                wait = max(bucket.reset - now, 0.05) if bucket.limit is not None else 0.05
+                self._lock.wait(timeout=wait)
+
+    def release(self, key: str, response: Optional[requests.Response] = None) -> None:
+        """Return a claimed slot and update the bucket from the response's rate-limit headers."""
+        with self._lock:
+            bucket = self._bucket(key)
+            bucket.in_flight -= 1
+            if response is not None:
+                self._update(bucket, response)
+            self._lock.notify_all()
+
+    def _update(self, bucket: RateLimitBucket, response: requests.Response) -> None:
+        headers = response.headers
+        try:
+            limit = int(headers['X-Rate-Limit-Limit'])
+            remaining = int(headers['X-Rate-Limit-Remaining'])
+            reset = float(headers['X-Rate-Limit-Reset'])
+        except (KeyError, ValueError):
+            if bucket.metered is None:
+                bucket.metered = False
+            return
+        bucket.metered = True
+
+        if bucket.limit is None or reset > bucket.reset:
+            # A new window: whatever the previous one had left over went unused.
+            if bucket.limit is not None:
+                bucket.unused += bucket.remaining
+            bucket.windows += 1
+            bucket.limit, bucket.remaining, bucket.reset = limit, remaining, reset
+        elif reset == bucket.reset:
+            # Responses can arrive out of order; the lowest remaining count is the current one.
+            bucket.remaining = min(bucket.remaining, remaining)
+
+    def _retry_delay(self, bucket: RateLimitBucket, response: Optional[requests.Response], attempt: int) -> float:
+        if response is not None and response.status_code == 429:
+            reset = response.headers.get('X-Rate-Limit-Reset')
+            if reset:
+                try:
+                    # Jitter spreads the retries of concurrent workers across the new window.
+                    return max(float(reset) - time.time(), 0) + random.uniform(0.1, 1.0)
+                except ValueError:
+                    pass
+        return min(self.backoff * (2 ** attempt), self.max_backoff) + random.uniform(0, self.backoff)
+
+    def request(self, session: requests.Session, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request through the scheduler, retrying throttled and failed attempts."""
+        key = bucket_key(url)
+        for attempt in range(self.max_retries + 1):
+            self.acquire(key)
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+                record_http(key, response.status_code, len(response.content), time.perf_counter() - started)
+            except (requests.ConnectionError, requests.Timeout):
+                record_http(key, 'error', 0, time.perf_counter() - started)
+                self.release(key)
+                if attempt == self.max_retries:
+                    raise
+                response = None
+            except Exception:
+                self.release(key)
+                raise
+            else:
+                self.release(key, response)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+
+            with self._lock:
+                bucket = self._bucket(key)
+                bucket.retries += 1
+            record_retry(key)
+            delay = self._retry_delay(bucket, response, attempt)
+            status = response.status_code if response is not None else 'connection error'
+            print(f"Request to {key} failed ({status}); retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1} of {self.max_retries})")
+            time.sleep(delay)
+
+    def get(self, session: requests.Session, url: str, **kwargs) -> requests.Response:
+        return self.request(session, 'GET', url, **kwargs)
+
+    def report(self) -> Dict[str, Dict]:
+        """Summarise request counts, throttling and unused budget for every bucket."""
+        with self._lock:
+            summary = {}
+            for key, bucket in self.buckets.items():
+                unused = bucket.unused + (bucket.remaining or 0)
+                budget = (bucket.limit or 0) * bucket.windows
+                summary[key] = {
+                    'requests': bucket.requests,
+                    'retries': bucket.retries,
+                    'limit': bucket.limit,
+                    'windows': bucket.windows,
+                    'unused': unused,
+                    'utilisation': round(1 - unused / budget, 3) if budget else None,
+                    'throttle_waits': bucket.throttle_waits,
+                    'throttle_seconds': round(bucket.throttle_seconds, 2),
+                }
+            return summary
+
+    def print_report(self) -> None:
+        """Print the rate-limit report in a readable form."""
+        print("\nRate-limit usage by endpoint:")
+        for key, stats in self.report().items():
+            if stats['limit'] is None:
+                print(f"  {key}: {stats['requests']} requests, {stats['retries']} retries, no rate-limit headers")
+                continue
+            utilisation = f"{stats['utilisation']:.0%}" if stats['utilisation'] is not None else "n/a"
+            print(f"  {key}: {stats['requests']} requests, {stats['retries']} retries, "
+                  f"{stats['unused']} of {stats['limit']}/window unused over {stats['windows']} window(s) "
+                  f"({utilisation} used), throttled {stats['throttle_waits']}x for {stats['throttle_seconds']}s")
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
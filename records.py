@@ -0,0 +1,273 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Okta application signOnMode -> Terraform resource type.
+OKTA_APP_TYPES = {
+    "SAML_2_0": "okta_app_saml",
+    "OPENID_CONNECT": "okta_app_oauth",
+    "BOOKMARK": "okta_app_bookmark",
+    "AUTO_LOGIN": "okta_app_auto_login",
+    "BASIC_AUTH": "okta_app_basic_auth",
+    "BROWSER_PLUGIN": "okta_app_swa",
+    "SECURE_PASSWORD_STORE": "okta_app_secure_password_store",
+}
+# SWA apps with a third (extra) field are a separate resource type.
+OKTA_THREE_FIELD_APP = "template_swa3field"
+
+# Cloud Asset Inventory asset type -> (import resource type, Terraform resource type).
+# The asset's full resource name, minus its //service.googleapis.com/ prefix,
+# is the import ID Terraform expects for each of these.
+GCP_ASSET_TYPES = {
+    "compute.googleapis.com/Instance": ("instances", "google_compute_instance"),
+    "storage.googleapis.com/Bucket": ("buckets", "google_storage_bucket"),
+    "compute.googleapis.com/Disk": ("disks", "google_compute_disk"),
+    "compute.googleapis.com/Network": ("networks", "google_compute_network"),
+    "compute.googleapis.com/Subnetwork": ("subnetworks", "google_compute_subnetwork"),
+    "compute.googleapis.com/Firewall": ("firewalls", "google_compute_firewall"),
+    "iam.googleapis.com/ServiceAccount": ("service_accounts", "google_service_account"),
+    "iam.googleapis.com/Role": ("custom_roles", "google_project_iam_custom_role"),
+    "sqladmin.googleapis.com/Instance": ("sql_instances", "google_sql_database_instance"),
+    "pubsub.googleapis.com/Topic": ("pubsub_topics", "google_pubsub_topic"),
+    "pubsub.googleapis.com/Subscription": ("pubsub_subscriptions", "google_pubsub_subscription"),
+}
+
+# The attributes kept for each Terraform resource type, in the order they are
+# stored in ResourceRecord.attrs.  Everything else in the API object is dropped.
+RECORD_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "okta_user": ("login", "email", "first_name", "last_name", "status"),
+    "okta_group": ("name", "description", "type"),
+    "okta_group_memberships": ("group_id", "users"),
+    "okta_app_group_assignments": ("app_id", "groups"),
+    "google_compute_instance": ("project", "zone", "machine_type", "boot_disk", "network", "subnetwork",
+                                "external_access"),
+    "google_storage_bucket": ("location", "storage_class"),
+}
+for _app_type in (*OKTA_APP_TYPES.values(), "okta_app_three_field"):
+    RECORD_FIELDS[_app_type] = ("label", "status", "sign_on_mode")
+for _, _asset_terraform_type in GCP_ASSET_TYPES.values():
+    RECORD_FIELDS.setdefault(_asset_terraform_type, ("project", "location"))
+RECORD_FIELDS["google_organization_iam_custom_role"] = ("organization", "location")
+
+
+class ResourceRecord:
+    """A compact, provider-neutral view of one fetched resource.
+
+    Handlers project API objects into records as soon as they are parsed, so
+    import generation, deduplication and snapshots never hold the full
+    objects.  `name` is the human-readable name the address is derived from.
+    """
+
+    __slots__ = ("terraform_type", "id", "name", "import_id", "updated", "attrs")
+
+    def __init__(self, terraform_type: str, id: str, name: str, import_id: str,
+                 updated: Optional[str] = None, attrs: Tuple = ()):
+        self.terraform_type = terraform_type
+        self.id = id
+        self.name = name
+        self.import_id = import_id
+        self.updated = updated
+        self.attrs = attrs
+
+    def attr(self, field: str) -> Optional[str]:
+        """Return one of the attributes listed in RECORD_FIELDS for this record's type."""
+        try:
+            return self.attrs[RECORD_FIELDS[self.terraform_type].index(field)]
+        except (KeyError, ValueError, IndexError):
+            return None
+
+    def to_dict(self) -> Dict:
+        """Serialise for snapshots."""
+        return {
+            "type": self.terraform_type,
+            "id": self.id,
+            "name": self.name,
+            "import_id": self.import_id,
+            "updated": self.updated,
+            "attrs": dict(zip(RECORD_FIELDS.get(self.terraform_type, ()), self.attrs)),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ResourceRecord":
+        fields = RECORD_FIELDS.get(data["type"], ())
+        attrs = data.get("attrs") or {}
+        # JSON turns tuples (e.g. member ids) into lists; turn them back so records compare equal.
+        values = (attrs.get(field) for field in fields)
+        return cls(data["type"], data["id"], data["name"], data["import_id"], data.get("updated"),
+                   tuple(tuple(value) if isinstance(value, list) else value for value in values))
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ResourceRecord) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        return f"ResourceRecord({self.terraform_type}, {self.id!r}, {self.name!r})"
+
+
+def _field(obj, name: str, default=None):
+    """Read a field from either a dict (JSON) or an SDK object."""
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def _last_segment(url: Optional[str]) -> Optional[str]:
+    """Return the last path segment of a GCP resource URL, e.g. a zone or machine type name."""
+    return url.rsplit("/", 1)[-1] if url else url
+
+
+def project_okta_user(item: Dict) -> ResourceRecord:
+    profile = item["profile"]
+    return ResourceRecord(
+        "okta_user", item["id"], f"{profile['firstName']}_{profile['lastName']}", item["id"],
+        item.get("lastUpdated"),
+        (profile.get("login"), profile.get("email"), profile["firstName"], profile["lastName"], item.get("status")),
+    )
+
+
+def project_okta_group(item: Dict) -> ResourceRecord:
+    profile = item["profile"]
+    return ResourceRecord(
+        "okta_group", item["id"], profile["name"], item["id"], item.get("lastUpdated"),
+        (profile["name"], profile.get("description"), item.get("type")),
+    )
+
+
+def project_okta_app(item: Dict) -> Optional[ResourceRecord]:
+    sign_on_mode = item.get("signOnMode")
+    terraform_type = OKTA_APP_TYPES.get(sign_on_mode)
+    if sign_on_mode == "BROWSER_PLUGIN" and item.get("name") == OKTA_THREE_FIELD_APP:
+        terraform_type = "okta_app_three_field"
+    if terraform_type is None:
+        print(f"Skipping application {item.get('label')} (ID: {item.get('id')}): "
+              f"sign-on mode {sign_on_mode} has no Terraform resource")
+        return None
+    return ResourceRecord(
+        terraform_type, item["id"], item["label"], item["id"], item.get("lastUpdated"),
+        (item["label"], item.get("status"), sign_on_mode),
+    )
+
+
+def group_memberships_record(group: ResourceRecord, user_ids: List[str]) -> ResourceRecord:
+    """okta_group_memberships for one group; the provider imports it by group ID."""
+    return ResourceRecord("okta_group_memberships", group.id, group.name, group.id, None,
+                          (group.id, tuple(user_ids)))
+
+
+def app_group_assignments_record(app: ResourceRecord, group_ids: List[str]) -> ResourceRecord:
+    """okta_app_group_assignments for one app; the provider imports it by app ID."""
+    return ResourceRecord("okta_app_group_assignments", app.id, app.name, app.id, None,
+                          (app.id, tuple(group_ids)))
+
+
+def project_gcp_instance(instance) -> ResourceRecord:
+    name = _field(instance, "name")
+    self_link = _field(instance, "self_link")
+    if not name or not self_link:
+        raise KeyError("name" if not name else "self_link")
+    # The self link ends in projects/{project}/zones/{zone}/instances/{name}, the provider's import ID.
+    import_id = self_link.split("/compute/v1/", 1)[-1]
+    boot_disk = next((disk for disk in _field(instance, "disks") or () if _field(disk, "boot")), None)
+    interfaces = _field(instance, "network_interfaces") or ()
+    interface = interfaces[0] if interfaces else None
+    return ResourceRecord(
+        "google_compute_instance", str(_field(instance, "id") or import_id), name, import_id, None,
+        (import_id.split("/")[1], _last_segment(_field(instance, "zone")),
+         _last_segment(_field(instance, "machine_type")),
+         _field(boot_disk, "source") if boot_disk else None,
+         _field(interface, "network") if interface else None,
+         _field(interface, "subnetwork") if interface else None,
+         bool(_field(interface, "access_configs")) if interface else None),
+    )
+
+
+def project_gcp_bucket(bucket) -> ResourceRecord:
+    name = _field(bucket, "name")
+    if not name:
+        raise KeyError("name")
+    return ResourceRecord(
+        "google_storage_bucket", name, name, name, None,
+        (_field(bucket, "location"), _field(bucket, "storage_class")),
+    )
+
+
+def project_gcp_asset(result) -> Optional[ResourceRecord]:
+    """Project a Cloud Asset Inventory search result.  Returns None for asset types with no mapping."""
+    asset_type = _field(result, "asset_type")
+    full_name = _field(result, "name")
+    if asset_type not in GCP_ASSET_TYPES:
+        return None
+    if not full_name:
+        raise KeyError("name")
+    _, terraform_type = GCP_ASSET_TYPES[asset_type]
+    # //compute.googleapis.com/projects/p/zones/z/instances/vm -> projects/p/zones/z/instances/vm
+    import_id = full_name.split("/", 3)[3]
+    segments = import_id.split("/")
+    name = segments[-1]
+
+    if asset_type == "iam.googleapis.com/Role" and segments[0] == "organizations":
+        terraform_type = "google_organization_iam_custom_role"
+    if asset_type == "iam.googleapis.com/ServiceAccount":
+        # Search results name service accounts by unique ID; Terraform imports them by email.
+        attributes = _field(result, "additional_attributes") or {}
+        email = attributes.get("email") if hasattr(attributes, "get") else None
+        if email:
+            import_id = f"projects/{segments[1]}/serviceAccounts/{email}"
+            name = email.split("@")[0]
+
+    parents = dict(zip(segments[0::2], segments[1::2]))
+    values = {
+        "project": parents.get("projects") or (_field(result, "project") or "").replace("projects/", "") or None,
+        "organization": parents.get("organizations"),
+        "location": _field(result, "location"),
+        "zone": parents.get("zones"),
+    }
+    update_time = _field(result, "update_time")
+    return ResourceRecord(
+        terraform_type, import_id, name, import_id,
+        update_time.isoformat() if hasattr(update_time, "isoformat") else update_time,
+        tuple(values.get(field) for field in RECORD_FIELDS[terraform_type]),
+    )
+
+
+# Import resource type -> (projection, description of the fields it needs)
+PROJECTIONS = {
+    "users": (project_okta_user, "'profile.firstName', 'profile.lastName' or 'id'"),
+    "groups": (project_okta_group, "'profile.name' or 'id'"),
+    "applications": (project_okta_app, "'label' or 'id'"),
+    "instances": (project_gcp_instance, "'name' or 'self_link'"),
+    "buckets": (project_gcp_bucket, "'name'"),
+}
+# Types only discovered through Cloud Asset Inventory take search results.
+for _resource_type, _ in GCP_ASSET_TYPES.values():
+    PROJECTIONS.setdefault(_resource_type, (project_gcp_asset, "'name'"))
+
+
+# Import resource types built from a parent record and its children's ids
+# (one sub-listing per parent) rather than projected from a single API object.
+DEPENDENT_RECORDS = {
+    "group_memberships": group_memberships_record,
+    "app_group_assignments": app_group_assignments_record,
+}
+
+
+def project_record(item, resource_type: str) -> Optional[ResourceRecord]:
+    """Project one API object into a ResourceRecord.  Returns None if required fields are missing."""
+    try:
+        projection, required = PROJECTIONS[resource_type]
+    except KeyError:
+        raise ValueError(f"Unsupported resource type: {resource_type}")
+    try:
+        return projection(item)
+    except (KeyError, TypeError) as e:
+        print(f"Skipping {resource_type[:-1]} with missing {required}: {e}")
+        return None
+
+
+def project_records(items: Iterable, resource_type: str) -> Iterator[ResourceRecord]:
+    """Project API objects into records, skipping unusable ones."""
+    for item in items:
+        record = project_record(item, resource_type)
+        if record is not None:
+            yield record
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
@@ -0,0 +1,154 @@
+import functools
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from records import ResourceRecord
+
+# Render resource blocks straight from ResourceRecords, so the common types do
+# not need `terraform plan -generate-config-out` (a provider read per
+# resource) to get a configuration.  Each renderer returns None when the
+# record lacks a required attribute; that resource is then left to the plan.
+
+SYNTHESIZED_CONFIG_PREFIX = "generated_"
+# Statuses the okta_user resource accepts; others (e.g. LOCKED_OUT) are transient and left unset.
+OKTA_USER_STATUSES = ("ACTIVE", "STAGED", "DEPROVISIONED", "SUSPENDED")
+
+# A renderer's result: (attributes, nested blocks), or None when the record cannot be rendered.
+Rendered = Optional[Tuple[List[Tuple[str, object]], List[str]]]
+
+_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r', '\t': '\\t'})
+_NEEDS_ESCAPE = re.compile(r'[\\"\n\r\t]|[$%]\{')
+
+
+def synthesized_config_file(resource_type: str) -> str:
+    """Return the file holding the synthesized resource blocks of an import resource type."""
+    return f"{SYNTHESIZED_CONFIG_PREFIX}{resource_type}.tf"
+
+
+def hcl_string(value) -> str:
+    """Quote a value as an HCL string, escaping template sequences as well as quotes."""
+    text = str(value)
+    # Most values need no escaping; one regex search is cheaper than the translate and replaces.
+    if _NEEDS_ESCAPE.search(text):
+        text = text.translate(_ESCAPES).replace('${', '$${').replace('%{', '%%{')
+    return f'"{text}"'
+
+
+def _value(value, indent: str) -> str:
+    if isinstance(value, str):
+        return hcl_string(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return "[]"
+        items = "".join(f"{indent}  {hcl_string(item)},\n" for item in value)
+        return f"[\n{items}{indent}]"
+    return hcl_string(value)
+
+
+@functools.lru_cache(maxsize=None)
+def _attribute_template(keys: Tuple[str, ...], indent: str) -> str:
+    """A format string for one set of attribute names, `=` aligned as terraform fmt does."""
+    width = max((len(key) for key in keys), default=0)
+    return "".join(f"{indent}{key:<{width}} = {{}}\n" for key in keys)
+
+
+def _body(attributes: Iterable[Tuple[str, object]], blocks: Iterable[str] = (), indent: str = "  ") -> str:
+    """Render attributes followed by nested blocks."""
+    attributes = [(key, value) for key, value in attributes if value is not None]
+    template = _attribute_template(tuple(key for key, _ in attributes), indent)
+    body = template.format(*(_value(value, indent) for _, value in attributes))
+    for block in blocks:
+        body += "\n" + block
+    return body
+
+
+def _nested(name: str, attributes: Iterable[Tuple[str, object]], blocks: Iterable[str] = (), indent: str = "  ") -> str:
+    body = _body(attributes, blocks, indent + "  ")
+    return f"{indent}{name} {{\n{body}{indent}}}\n" if body else f"{indent}{name} {{}}\n"
+
+
+# Renderers unpack record.attrs in RECORD_FIELDS order; it is the hot path when writing large orgs.
+
+def render_okta_user(record: ResourceRecord) -> Rendered:
+    login, email, first_name, last_name, status = record.attrs
+    if not (login and email and first_name and last_name):
+        return None
+    return [
+        ("login", login),
+        ("email", email),
+        ("first_name", first_name),
+        ("last_name", last_name),
+        ("status", status if status in OKTA_USER_STATUSES else None),
+    ], []
+
+
+def render_okta_group(record: ResourceRecord) -> Rendered:
+    name, description, group_type = record.attrs
+    # Built-in groups (e.g. Everyone) are not managed through okta_group.
+    if not name or group_type == "BUILT_IN":
+        return None
+    return [("name", name), ("description", description)], []
+
+
+def render_okta_group_memberships(record: ResourceRecord) -> Rendered:
+    return [("group_id", record.attr("group_id")), ("users", list(record.attr("users") or ()))], []
+
+
+def render_okta_app_group_assignments(record: ResourceRecord) -> Rendered:
+    groups = [_nested("group", [("id", group_id)]) for group_id in record.attr("groups") or ()]
+    return [("app_id", record.attr("app_id"))], groups
+
+
+def render_google_compute_instance(record: ResourceRecord) -> Rendered:
+    # Instances found through Cloud Asset Inventory carry no machine type, disks or networks.
+    if not record.attr("machine_type") or not record.attr("boot_disk") or not (
+            record.attr("network") or record.attr("subnetwork")):
+        return None
+    access = [_nested("access_config", [], indent="    ")] if record.attr("external_access") else []
+    return [
+        ("name", record.name),
+        ("project", record.attr("project")),
+        ("zone", record.attr("zone")),
+        ("machine_type", record.attr("machine_type")),
+    ], [
+        _nested("boot_disk", [("source", record.attr("boot_disk"))]),
+        _nested("network_interface", [("network", record.attr("network")),
+                                      ("subnetwork", record.attr("subnetwork"))], access),
+    ]
+
+
+def render_google_storage_bucket(record: ResourceRecord) -> Rendered:
+    if not record.attr("location"):
+        return None
+    return [
+        ("name", record.name),
+        ("location", record.attr("location")),
+        ("storage_class", record.attr("storage_class")),
+    ], []
+
+
+# Terraform resource type -> renderer.
+RENDERERS: Dict[str, Callable[[ResourceRecord], Rendered]] = {
+    "okta_user": render_okta_user,
+    "okta_group": render_okta_group,
+    "okta_group_memberships": render_okta_group_memberships,
+    "okta_app_group_assignments": render_okta_app_group_assignments,
+    "google_compute_instance": render_google_compute_instance,
+    "google_storage_bucket": render_google_storage_bucket,
+}
+
+
+def render_resource(record: ResourceRecord, address: str) -> Optional[str]:
+    """Render the resource block for a record at an address, or None if its type or data is not supported."""
+    renderer = RENDERERS.get(record.terraform_type)
+    rendered = renderer(record) if renderer else None
+    if rendered is None:
+        return None
+    attributes, blocks = rendered
+    terraform_type, name = address.split(".", 1)
+    return f'resource "{terraform_type}" "{name}" {{\n{_body(attributes, blocks)}}}\n'
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
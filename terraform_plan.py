@@ -0,0 +1,339 @@
+import glob
+import hashlib
+import os
+import re
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Iterable, Iterator, Tuple
+from utils import check_terraform_init, ensure_plugin_cache
+from terraform_hcl import SYNTHESIZED_CONFIG_PREFIX
+from metrics import phase
+from terraform_runner import ErrorReport, Progress, max_errors_from_env, run_terraform
+
+GENERATED_CONFIG_FILE = "terraform-importer-created.tf"
+PLAN_ERROR_LOG = "terraform_plan_error.log"
+SHARD_ROOT = os.path.join(".terraform_importer", "shards")
+# Generated config of every shard planned successfully, keyed by the hash of what the plan read.
+PLAN_CACHE_ROOT = os.path.join(".terraform_importer", "plan_cache")
+# Files besides the shared configuration that change what a plan generates.
+PLAN_INPUT_FILES = (".terraform.lock.hcl", "terraform.tfstate")
+# Roughly how many imports one plan process should handle before it is worth another shard.
+IMPORTS_PER_SHARD = 2000
+
+_IMPORT_TO = re.compile(r'^\s*to\s*=\s*(\S+)')
+_RESOURCE_HEADER = re.compile(r'^resource\s+"([^"]+)"\s+"([^"]+)"')
+_GENERATED_HEADER = (
+    "# __generated__ by Terraform\n"
+    "# Please review these resources and move them into your main configuration files.\n"
+)
+
+
+def read_import_blocks(pattern: str = "output_file_*.tf") -> Iterator[Tuple[str, str]]:
+    """Yield (address, block text) for every import block in the matching files."""
+    for file_path in sorted(glob.glob(pattern)):
+        with open(file_path, "r") as file:
+            block, address = [], None
+            for line in file:
+                if not block and not line.startswith("import {"):
+                    continue
+                block.append(line)
+                match = _IMPORT_TO.match(line)
+                if match:
+                    address = match.group(1)
+                if line.rstrip() == "}":
+                    if address:
+                        yield address, "".join(block)
+                    block, address = [], None
+
+
+def shard_for(address: str, shard_count: int) -> int:
+    """Assign an address to a shard.  Stable across runs, so unchanged imports stay in the same shard."""
+    return zlib.crc32(address.encode()) % shard_count
+
+
+def split_import_blocks(blocks: Iterable[Tuple[str, str]], shard_count: int) -> List[List[str]]:
+    """Split import blocks into `shard_count` groups, dropping repeated addresses.
+
+    Each group is sorted by address, so its content hash does not depend on
+    the order the blocks were written in (e.g. by a partitioned crawl).
+    """
+    shards = [{} for _ in range(shard_count)]
+    seen = set()
+    for address, block in blocks:
+        if address in seen:
+            continue
+        seen.add(address)
+        shards[shard_for(address, shard_count)][address] = block
+    return [[shard[address] for address in sorted(shard)] for shard in shards]
+
+
+def default_shard_count(import_count: int) -> int:
+    """Pick a shard count from the number of imports, capped at the CPU count."""
+    return max(1, min(os.cpu_count() or 1, -(-import_count // IMPORTS_PER_SHARD)))
+
+
+def shared_config_files(work_dir: str = ".") -> List[str]:
+    """Return the configuration every shard needs: all .tf files except import, generated and synthesized files."""
+    files = []
+    for file_path in sorted(glob.glob(os.path.join(work_dir, "*.tf"))):
+        name = os.path.basename(file_path)
+        if name.startswith(("output_file_", SYNTHESIZED_CONFIG_PREFIX)) or name == GENERATED_CONFIG_FILE:
+            continue
+        files.append(file_path)
+    return files
+
+
+def config_digest(work_dir: str = ".") -> "hashlib._Hash":
+    """Hash the inputs every shard shares: the shared configuration, the lockfile and local state."""
+    digest = hashlib.sha256()
+    input_files = shared_config_files(work_dir) + [os.path.join(work_dir, name) for name in PLAN_INPUT_FILES]
+    for file_path in input_files:
+        if not os.path.exists(file_path):
+            continue
+        digest.update(os.path.basename(file_path).encode() + b"\0")
+        with open(file_path, "rb") as f:
+            digest.update(f.read())
+    return digest
+
+
+def shard_digest(base: "hashlib._Hash", blocks: List[str]) -> str:
+    """Return the content hash of one shard: the shared inputs plus its import blocks."""
+    digest = base.copy()
+    for block in blocks:
+        digest.update(block.encode())
+    return digest.hexdigest()
+
+
+def cache_generated_config(generated_file: str, cache_file: str) -> None:
+    """Copy a shard's generated config into the plan cache atomically."""
+    if os.path.exists(generated_file):
+        shutil.copyfile(generated_file, f"{cache_file}.tmp")
+    else:
+        # Nothing to generate (e.g. every resource is already in state) is a result worth keeping too.
+        open(f"{cache_file}.tmp", "w").close()
+    os.replace(f"{cache_file}.tmp", cache_file)
+
+
+def prune_plan_cache(cache_dir: str, keep: Iterable[str]) -> None:
+    """Remove cached config that no current shard uses, so the cache does not grow with every change."""
+    keep = set(keep)
+    for file_path in glob.glob(os.path.join(cache_dir, "*.tf")):
+        if file_path not in keep:
+            os.remove(file_path)
+
+
+def prepare_shard(shard_dir: str, blocks: List[str], work_dir: str = ".") -> None:
+    """Create a working directory holding the shared provider config and one shard of import blocks."""
+    if os.path.isdir(shard_dir):
+        shutil.rmtree(shard_dir)
+    os.makedirs(shard_dir)
+
+    for file_path in shared_config_files(work_dir):
+        shutil.copy2(file_path, shard_dir)
+    for name in (".terraform.lock.hcl", "terraform.tfstate"):
+        if os.path.exists(os.path.join(work_dir, name)):
+            shutil.copy2(os.path.join(work_dir, name), shard_dir)
+
+    # Reuse the initialised providers instead of downloading them again for every shard.
+    terraform_dir = os.path.abspath(os.path.join(work_dir, ".terraform"))
+    if os.path.isdir(terraform_dir):
+        try:
+            os.symlink(terraform_dir, os.path.join(shard_dir, ".terraform"), target_is_directory=True)
+        except OSError:
+            pass
+
+    with open(os.path.join(shard_dir, "imports.tf"), "w") as f:
+        f.writelines(blocks)
+
+
+def plan_shard(shard_dir: str, report: Optional[ErrorReport] = None,
+               progress: Optional[Progress] = None) -> Tuple[str, bool, str]:
+    """Run terraform plan -generate-config-out in a shard.
+
+    Returns (shard_dir, succeeded, output of a failure terraform reported no diagnostics for).
+
+    Errors are added to `report`, which may be shared with other shards; a
+    shard is not started, or is stopped, once its error threshold is reached.
+    """
+    report = report if report is not None else ErrorReport()
+    if report.exceeded():
+        return shard_dir, False, ""
+    # Normally linked to work_dir's; if linking failed, init through the lock that keeps the plugin cache safe.
+    if not os.path.exists(os.path.join(shard_dir, ".terraform")) and not check_terraform_init(shard_dir):
+        return shard_dir, False, "terraform init failed (see the output above)"
+    # Plans only read state, so shards skip the state lock instead of queueing on it.
+    run = run_terraform(
+        ["terraform", "plan", "-input=false", "-lock=false", "-json", f"-generate-config-out={GENERATED_CONFIG_FILE}"],
+        cwd=shard_dir, report=report, progress=progress
+    )
+    return shard_dir, run.ok, run.error_text()
+
+
+def parse_generated_config(file_path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (address, block text) for each resource in a -generate-config-out file.
+
+    A block's leading comment lines (e.g. `# __generated__ by Terraform from "id"`) stay with it.
+    """
+    with open(file_path, "r") as file:
+        comments, block, address = [], [], None
+        for line in file:
+            if address is None:
+                match = _RESOURCE_HEADER.match(line)
+                if match:
+                    address = f"{match.group(1)}.{match.group(2)}"
+                    block = comments + [line]
+                    comments = []
+                elif line.startswith("#"):
+                    comments.append(line)
+                elif not line.strip():
+                    comments = []
+                continue
+
+            block.append(line)
+            if line.rstrip() == "}":
+                yield address, "".join(block)
+                block, address = [], None
+
+
+def synthesized_addresses(work_dir: str = ".") -> set:
+    """Return the addresses whose resource blocks were synthesized by the importer (generated_*.tf)."""
+    pattern = os.path.join(work_dir, f"{SYNTHESIZED_CONFIG_PREFIX}*.tf")
+    return {address for file_path in glob.glob(pattern) for address, _ in parse_generated_config(file_path)}
+
+
+def merge_generated_configs(file_paths: Iterable[str], output_file: str = GENERATED_CONFIG_FILE) -> int:
+    """Merge generated config files into one, sorted by address with duplicates dropped.  Returns the resource count."""
+    resources: Dict[str, str] = {}
+    for file_path in file_paths:
+        for address, block in parse_generated_config(file_path):
+            resources.setdefault(address, block)
+
+    with open(output_file, "w") as f:
+        f.write(_GENERATED_HEADER)
+        for address in sorted(resources):
+            f.write("\n")
+            f.write(resources[address])
+    return len(resources)
+
+
+def run_sharded_plan(shard_count: Optional[int] = None, max_workers: Optional[int] = None,
+                     pattern: str = "output_file_*.tf", work_dir: str = ".", max_errors: Optional[int] = None) -> bool:
+    """Generate config for every import block by planning shards in parallel, then merge the results.
+
+    Imports whose resource blocks the importer synthesized itself
+    (generated_*.tf) are left out; only the rest need the provider to read
+    them.  Each shard's generated config is cached under its content hash, so
+    only shards whose import blocks, shared configuration, lockfile or state
+    have changed since the last run are planned again.  When nothing has
+    changed no plan runs at all.  Progress is printed as the shards' plans
+    report each import, and every shard stops once `max_errors` errors (by
+    default TERRAFORM_IMPORTER_MAX_PLAN_ERRORS) have been reported between them.
+    Returns True if every shard planned successfully.
+    """
+    with phase("plan"):
+        return _run_sharded_plan(shard_count, max_workers, pattern, work_dir, max_errors or max_errors_from_env())
+
+
+def _run_sharded_plan(shard_count: Optional[int], max_workers: Optional[int], pattern: str, work_dir: str,
+                      max_errors: Optional[int]) -> bool:
+    # Shards that cannot reuse .terraform still install providers from the shared cache.
+    ensure_plugin_cache()
+    blocks = list(read_import_blocks(os.path.join(work_dir, pattern)))
+    if not blocks:
+        print("No import blocks found; nothing to plan.")
+        return False
+    synthesized = synthesized_addresses(work_dir)
+    if synthesized:
+        blocks = [(address, block) for address, block in blocks if address not in synthesized]
+        print(f"{len(synthesized)} resources already have synthesized configuration; "
+              f"{len(blocks)} need config generated by terraform plan.")
+
+    shard_count = shard_count or default_shard_count(len(blocks))
+    shard_root = os.path.join(work_dir, SHARD_ROOT)
+    cache_dir = os.path.join(work_dir, PLAN_CACHE_ROOT)
+    os.makedirs(cache_dir, exist_ok=True)
+    base = config_digest(work_dir)
+
+    cached, changed = [], []
+    for index, shard in enumerate(split_import_blocks(blocks, shard_count)):
+        if not shard:
+            continue
+        cache_file = os.path.join(cache_dir, f"{shard_digest(base, shard)}.tf")
+        if os.path.exists(cache_file):
+            cached.append(cache_file)
+        else:
+            changed.append((index, shard, cache_file))
+
+    # Init once here, before fanning out: the shards link this .terraform and copy its lockfile,
+    # rather than each installing providers into the shared plugin cache at the same time.
+    if changed and not check_terraform_init(work_dir):
+        return False
+    pending, pending_imports = {}, 0
+    for index, shard, cache_file in changed:
+        # Named by shard number, not position, so a shard keeps its directory when others are empty.
+        shard_dir = os.path.join(shard_root, f"shard_{index}")
+        prepare_shard(shard_dir, shard, work_dir)
+        pending[shard_dir] = cache_file
+        pending_imports += len(shard)
+
+    if pending:
+        print(f"Planning {len(blocks)} imports: {len(pending)} changed shard(s), {len(cached)} unchanged.")
+    elif cached:
+        print(f"The {len(blocks)} imports are unchanged since the last plan; reusing the generated config.")
+
+    generated, failures = list(cached), []
+    report, progress = ErrorReport(max_errors), Progress(pending_imports)
+    # More shards than CPUs (e.g. typed at the prompt) queue rather than all planning at once.
+    max_workers = max_workers or max(1, min(len(pending), os.cpu_count() or 1))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(lambda shard_dir: plan_shard(shard_dir, report, progress), pending)
+        for shard_dir, succeeded, error in results:
+            if succeeded:
+                cache_generated_config(os.path.join(shard_dir, GENERATED_CONFIG_FILE), pending[shard_dir])
+                generated.append(pending[shard_dir])
+                print(f"  {shard_dir}: done")
+            else:
+                failures.append((shard_dir, error))
+                print(f"  {shard_dir}: FAILED")
+    prune_plan_cache(cache_dir, generated)
+
+    # Rewritten even when empty, so it never repeats a resource that is now synthesized.
+    output_file = os.path.join(work_dir, GENERATED_CONFIG_FILE)
+    count = merge_generated_configs(generated, output_file)
+    print(f"Terraform plan file created ({output_file}) with {count} resources.  "
+          "Review this file carefully before applying!")
+
+    if failures:
+        for shard_dir, error in failures:
+            # Failures terraform reported no diagnostics for (e.g. a failed init) keep their output instead.
+            if error:
+                report.add({"summary": "terraform failed", "detail": error}, os.path.basename(shard_dir))
+        report.write(os.path.join(work_dir, PLAN_ERROR_LOG))
+        stopped = "  Stopped early at the error threshold." if report.exceeded() else ""
+        print(f"{len(failures)} shard(s) failed with {report.count} error(s).{stopped}  "
+              f"Detailed error information has been logged to {PLAN_ERROR_LOG}")
+    return not failures
+
+
+def check_plan(work_dir: str = ".", max_errors: Optional[int] = None) -> bool:
+    """Run a plain terraform plan over the imports and their configuration as a final check.  Returns True if it succeeds."""
+    imports = sum(1 for _ in read_import_blocks(os.path.join(work_dir, "output_file_*.tf")))
+    report = ErrorReport(max_errors or max_errors_from_env())
+    with phase("plan"):
+        run = run_terraform(["terraform", "plan", "-input=false", "-lock=false", "-json"], cwd=work_dir,
+                            report=report, progress=Progress(imports, "Checking"))
+    if not run.ok:
+        if run.error_text():
+            report.add({"summary": "terraform failed", "detail": run.error_text()}, os.path.basename(os.path.abspath(work_dir)))
+        report.write(os.path.join(work_dir, PLAN_ERROR_LOG))
+        stopped = "  Stopped early at the error threshold." if run.stopped else ""
+        print(f"Terraform plan failed with {report.count} error(s).{stopped}  "
+              f"Detailed error information has been logged to {PLAN_ERROR_LOG}")
+        return False
+    print(run.summary or "Terraform plan succeeded.")
+    return True
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
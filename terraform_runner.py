@@ -0,0 +1,214 @@
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+from metrics import record_subprocess
+
+# Run terraform as a stream: output is read line by line as it arrives rather
+# than held until the process exits, so a plan over many thousands of imports
+# shows its progress, and can be stopped once too many resources have failed.
+# With -json each line is one event of terraform's machine-readable UI.
+
+# Stop after this many errors; unset or 0 runs to completion.
+MAX_ERRORS_ENV = "TERRAFORM_IMPORTER_MAX_PLAN_ERRORS"
+# Full diagnostics kept per report; beyond this errors are only counted by summary.
+MAX_REPORTED_ERRORS = 200
+MAX_ERROR_SUMMARIES = 100
+# Plain (non-JSON) output lines kept for the error log.
+OUTPUT_TAIL_LINES = 50
+PROGRESS_INTERVAL = 10.0
+
+
+def max_errors_from_env() -> Optional[int]:
+    """Return the error threshold set in the environment, or None if there is none."""
+    value = os.environ.get(MAX_ERRORS_ENV, "")
+    return int(value) if value.isdigit() and int(value) > 0 else None
+
+
+class ErrorReport:
+    """Error diagnostics from one or more terraform runs, in bounded memory.
+
+    The first MAX_REPORTED_ERRORS diagnostics are kept in full; after that
+    errors are only counted by their summary.  Shared by the shards of a plan,
+    so the error threshold applies to the plan as a whole.
+    """
+
+    def __init__(self, max_errors: Optional[int] = None):
+        self.max_errors = max_errors
+        self.count = 0
+        self.errors: List[Dict] = []
+        self.summaries: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, diagnostic: Dict, source: str = "") -> None:
+        summary = diagnostic.get("summary") or "Unknown error"
+        with self._lock:
+            self.count += 1
+            if summary in self.summaries or len(self.summaries) < MAX_ERROR_SUMMARIES:
+                self.summaries[summary] = self.summaries.get(summary, 0) + 1
+            else:
+                self.summaries["(other)"] = self.summaries.get("(other)", 0) + 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append({"source": source, "address": diagnostic.get("address"), "summary": summary,
+                                    "detail": diagnostic.get("detail", "")})
+
+    def exceeded(self) -> bool:
+        """True once the error threshold, if any, has been reached."""
+        return self.max_errors is not None and self.count >= self.max_errors
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {"errors": self.count, "max_errors": self.max_errors, "stopped_early": self.exceeded(),
+                    "by_summary": dict(self.summaries), "details": list(self.errors)}
+
+    def write(self, log_path: str) -> None:
+        """Write the report as text to log_path, and as JSON next to it."""
+        report = self.to_dict()
+        with open(f"{os.path.splitext(log_path)[0]}.json", "w") as f:
+            json.dump(report, f, indent=2)
+        with open(log_path, "w") as f:
+            f.write(f"{report['errors']} error(s)")
+            f.write(" (stopped early at the error threshold)\n" if report["stopped_early"] else "\n")
+            for summary, count in sorted(report["by_summary"].items(), key=lambda item: -item[1]):
+                f.write(f"  {count:6d}  {summary}\n")
+            for error in report["details"]:
+                f.write(f"\n=== {error['source']} {error['address'] or ''} ===\n{error['summary']}\n{error['detail']}\n")
+            if report["errors"] > len(report["details"]):
+                f.write(f"\n... {report['errors'] - len(report['details'])} more error(s) counted above.\n")
+
+
+class Progress:
+    """Import progress across the shards of a plan, printed at most every PROGRESS_INTERVAL seconds."""
+
+    def __init__(self, total: int, label: str = "Planning"):
+        self.total = total
+        self.label = label
+        self.done = 0
+        self.started = time.monotonic()
+        self._printed = self.started
+        self._lock = threading.Lock()
+
+    def advance(self, errors: int = 0) -> None:
+        with self._lock:
+            self.done += 1
+            now = time.monotonic()
+            if now - self._printed < PROGRESS_INTERVAL:
+                return
+            self._printed = now
+            done, total, elapsed = self.done, self.total, now - self.started
+        eta = f", ETA {_duration(elapsed * (total - done) / done)}" if 0 < done < total else ""
+        print(f"  {self.label}: {done}/{total} imports ({100 * done // max(total, 1)}%), {errors} error(s){eta}")
+
+
+def _duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class TerraformRun:
+    """The outcome of a streamed terraform command."""
+
+    def __init__(self, args: List[str], report: ErrorReport):
+        self.args = args
+        self.report = report
+        self.returncode: Optional[int] = None
+        self.stopped = False
+        # Error diagnostics this run added to the report.
+        self.errors = 0
+        # Latest change_summary counts (add, change, import, remove), from -json plans.
+        self.changes: Dict[str, int] = {}
+        self.summary = ""
+        self.output = deque(maxlen=OUTPUT_TAIL_LINES)
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.stopped
+
+    def error_text(self) -> str:
+        """The plain output kept from a failed run that reported no diagnostics; empty otherwise."""
+        return "" if self.ok or self.stopped or self.errors else "\n".join(self.output)
+
+
+def run_terraform(args: List[str], cwd: str = ".", report: Optional[ErrorReport] = None,
+                  progress: Optional[Progress] = None, echo: bool = False) -> TerraformRun:
+    """Run a terraform command, handling its output line by line as it is produced.
+
+    JSON events (from -json) feed the error report and the progress count;
+    other lines are kept in a bounded tail and printed if `echo` is set.  When
+    the report's error threshold is reached the process is interrupted and
+    the run marked as stopped.  Raises FileNotFoundError if terraform is not installed.
+    """
+    run = TerraformRun(args, report if report is not None else ErrorReport())
+    source = os.path.basename(os.path.abspath(cwd))
+    started = time.perf_counter()
+    process = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
+    try:
+        for line in process.stdout:
+            event = _parse_event(line)
+            if event is None:
+                line = line.rstrip()
+                run.output.append(line)
+                if echo and line:
+                    print(line)
+                continue
+            _handle_event(run, event, source, progress)
+            if run.report.exceeded():
+                run.stopped = True
+                _stop(process)
+                break
+        run.returncode = process.wait()
+    except BaseException:
+        _stop(process)
+        raise
+    finally:
+        process.stdout.close()
+        record_subprocess(args, time.perf_counter() - started, run.returncode != 0)
+    return run
+
+
+def _parse_event(line: str) -> Optional[Dict]:
+    if not line.startswith("{"):
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def _handle_event(run: TerraformRun, event: Dict, source: str, progress: Optional[Progress]) -> None:
+    kind = event.get("type")
+    if kind == "diagnostic":
+        diagnostic = event.get("diagnostic") or {}
+        if diagnostic.get("severity") == "error":
+            run.errors += 1
+            run.report.add(diagnostic, source)
+            if diagnostic.get("address") and progress:
+                progress.advance(run.report.count)
+        else:
+            run.output.append(event.get("@message", ""))
+    elif kind == "planned_change":
+        if progress:
+            progress.advance(run.report.count)
+    elif kind == "change_summary":
+        run.changes = (event.get("changes") or {})
+        run.summary = event.get("@message", "")
+
+
+def _stop(process: subprocess.Popen) -> None:
+    """Interrupt terraform, letting it release locks and exit cleanly if it can."""
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
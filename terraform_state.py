@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+from utils import is_offline
+from metrics import phase, run_subprocess
+
+STATE_FILE = "terraform.tfstate"
+
+
+class StateIndex:
+    """Managed resources of a Terraform state, indexed by (resource type, import ID).
+
+    Built once per working directory, so checking whether a fetched resource
+    is already managed is a single dictionary lookup.  Resources in child
+    modules count as managed too.
+    """
+
+    def __init__(self, source: Optional[str] = None):
+        self.source = source
+        self._managed: Dict[Tuple[str, str], str] = {}
+
+    def __len__(self) -> int:
+        return len(self._managed)
+
+    def add(self, terraform_type: str, resource_id: Optional[str], address: str) -> None:
+        if resource_id:
+            self._managed.setdefault((terraform_type, str(resource_id)), address)
+
+    def address_of(self, terraform_type: str, import_id: str) -> Optional[str]:
+        """Return the address managing a resource, or None if it is not in state."""
+        return self._managed.get((terraform_type, import_id))
+
+    def items(self) -> Iterator[Tuple[str, str, str]]:
+        """Yield (resource type, import ID, address) for every managed resource."""
+        for (terraform_type, resource_id), address in self._managed.items():
+            yield terraform_type, resource_id, address
+
+    @classmethod
+    def from_show_json(cls, data: Dict, source: str = "terraform show -json") -> "StateIndex":
+        """Index the output of `terraform show -json`."""
+        index = cls(source)
+        modules = [(data.get("values") or {}).get("root_module") or {}]
+        while modules:
+            module = modules.pop()
+            for resource in module.get("resources", []):
+                if resource.get("mode") == "managed":
+                    index.add(resource["type"], (resource.get("values") or {}).get("id"), resource["address"])
+            modules.extend(module.get("child_modules", []))
+        return index
+
+    @classmethod
+    def from_state_file(cls, state_path: str) -> "StateIndex":
+        """Index a local (version 4) state file.  A missing or unreadable file gives an empty index."""
+        index = cls(state_path)
+        try:
+            with open(state_path, "r") as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            return index
+
+        for resource in state.get("resources", []):
+            if resource.get("mode") != "managed":
+                continue
+            address = f"{resource['type']}.{resource['name']}"
+            if resource.get("module"):
+                address = f"{resource['module']}.{address}"
+            for instance in resource.get("instances", []):
+                index.add(resource["type"], (instance.get("attributes") or {}).get("id"), address)
+        return index
+
+
+def load_state_index(work_dir: str = ".") -> StateIndex:
+    """Load the state of a working directory, from `terraform show -json` if it is initialised, else terraform.tfstate."""
+    with phase("state"):
+        # `terraform show` reads whichever backend is configured (remote state too), but needs init.
+        if os.path.isdir(os.path.join(work_dir, ".terraform")) and not is_offline():
+            try:
+                result = run_subprocess(["terraform", "show", "-json"], cwd=work_dir,
+                                        capture_output=True, text=True, check=True)
+                return StateIndex.from_show_json(json.loads(result.stdout or "{}"))
+            except (subprocess.CalledProcessError, FileNotFoundError, ValueError) as e:
+                print(f"Could not read state with terraform show ({e}); falling back to {STATE_FILE}")
+        return StateIndex.from_state_file(os.path.join(work_dir, STATE_FILE))
+
+
+_state_indexes: Dict[str, StateIndex] = {}
+# One lock per directory, so collectors in different directories read their state at the same time.
+_state_index_locks: Dict[str, threading.Lock] = {}
+_state_index_locks_lock = threading.Lock()
+
+
+def get_state_index(work_dir: str = ".") -> StateIndex:
+    """Return the state index of a working directory, loading it on first use in this run."""
+    key = os.path.abspath(work_dir)
+    with _state_index_locks_lock:
+        lock = _state_index_locks.setdefault(key, threading.Lock())
+    with lock:
+        index = _state_indexes.get(key)
+        if index is None:
+            index = _state_indexes[key] = load_state_index(work_dir)
+            if len(index):
+                print(f"Loaded {len(index)} managed resources from {index.source}.")
+    return index
+
+
+#Copyright (c) 2025 Stephen Agius
+#Licensed under the GNU General Public License, version 3.
\ No newline at end of file
@@ -1,38 +1,144 @@
 import os
 import re
+import json
+import time
+import threading
 import requests
-import random
+import glob
 import subprocess
-from typing import List, Dict, Optional
-from utils import sanitize_name
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Optional, Iterable, Tuple, Union
+from records import ResourceRecord, PROJECTIONS, DEPENDENT_RECORDS, project_record
+from utils import sanitize_name, get_cache_dir, is_offline
+from metrics import phase, record_http, record_state_filter
+from terraform_state import StateIndex, get_state_index
+from terraform_hcl import render_resource, synthesized_config_file
 
 def clean_up() -> None:
     """Remove temporary Terraform-related files."""
     os.system("rm -rf .terraform .terraform.lock.hcl import_okta_resources.sh okta_provider.tf")
 
+PROVIDER_SOURCES = {
+    "okta": "okta/okta",
+    "google": "hashicorp/google",  #Different namespace to Okta
+}
+REGISTRY_URL = "https://registry.terraform.io/v1/providers"
+REGISTRY_TIMEOUT = 10
+REGISTRY_CACHE_TTL = int(os.environ.get("TERRAFORM_IMPORTER_REGISTRY_TTL", 24 * 60 * 60))
+DEFAULT_PROVIDER_VERSION = "~> 4.0"  # Default version if fetching fails
+
+_registry_lock = threading.Lock()
+_registry_requests: Dict[str, Future] = {}
+
+def _registry_cache_path() -> str:
+    return os.path.join(get_cache_dir(), "registry.json")
+
+def _load_registry_cache() -> Dict:
+    try:
+        with open(_registry_cache_path(), "r") as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def _store_registry_cache(path: str, data: Dict) -> None:
+    """Add one registry response to the on-disk cache."""
+    with _registry_lock:
+        cache = _load_registry_cache()
+        cache[path] = {"fetched": time.time(), "data": data}
+        cache_file = _registry_cache_path()
+        try:
+            with open(f"{cache_file}.tmp", "w") as f:
+                json.dump(cache, f)
+            os.replace(f"{cache_file}.tmp", cache_file)
+        except IOError as e:
+            print(f"Could not write the registry cache: {e}")
+
+def _fetch_registry(path: str) -> Optional[Dict]:
+    """Fetch a registry document, preferring a fresh cache entry and falling back to a stale one."""
+    cached = _load_registry_cache().get(path)
+    if cached and time.time() - cached["fetched"] < REGISTRY_CACHE_TTL:
+        return cached["data"]
+    if is_offline():
+        return cached["data"] if cached else None
+
+    started, response = time.perf_counter(), None
+    try:
+        response = requests.get(f"{REGISTRY_URL}/{path}", timeout=REGISTRY_TIMEOUT)
+        record_http("registry", response.status_code, len(response.content), time.perf_counter() - started)
+        if response.status_code == 404:
+            data = {"not_found": True}
+        else:
+            response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
+            payload = response.json()
+            data = {"version": payload.get("version"), "versions": payload.get("versions")}
+    except (requests.RequestException, ValueError) as e:
+        if response is None:
+            record_http("registry", "error", 0, time.perf_counter() - started)
+        print(f"Failed to query the Terraform registry for {path}: {e}")
+        if cached:
+            print(f"Using the cached registry entry for {path}.")
+            return cached["data"]
+        return None
+
+    _store_registry_cache(path, data)
+    return data
+
+def registry_lookup(path: str) -> Optional[Dict]:
+    """Look up a registry document, sharing one request between all callers in this process."""
+    with _registry_lock:
+        future = _registry_requests.get(path)
+        if future is None:
+            future = _registry_requests[path] = Future()
+            owner = True
+        else:
+            owner = False
+
+    if owner:
+        try:
+            with phase("registry"):
+                future.set_result(_fetch_registry(path))
+        except Exception as e:
+            future.set_exception(e)
+    return future.result()
+
+def _provider_source(provider_name: str) -> str:
+    try:
+        return PROVIDER_SOURCES[provider_name]
+    except KeyError:
+        raise ValueError(f"Unsupported provider: {provider_name}")
+
 def get_latest_provider_version(provider_name: str) -> str:
     """Fetch the latest provider version from the Terraform registry."""
-    if provider_name == "okta":
-        url = "https://registry.terraform.io/v1/providers/okta/okta"
-    elif provider_name == "google":
-         url = "https://registry.terraform.io/v1/providers/hashicorp/google" #Different URL to Okta
-    else:
-        raise ValueError(f"Unsupported provider: {provider_name}")
+    data = registry_lookup(_provider_source(provider_name))
+    if not data or not data.get("version"):
+        print(f"Failed to fetch the latest {provider_name} provider version; using {DEFAULT_PROVIDER_VERSION}")
+        return DEFAULT_PROVIDER_VERSION
+    return data["version"]
 
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-        data = response.json()
-        return data['version']
-    except requests.RequestException as e:
-        print(f"Failed to fetch the latest {provider_name} provider version: {e}")
-        return "~> 4.0"  # Default version if fetching fails
+def resolve_provider_versions(provider_names: Iterable[str]) -> Dict[str, str]:
+    """Resolve the latest version of several providers concurrently."""
+    provider_names = list(dict.fromkeys(provider_names))
+    with ThreadPoolExecutor(max_workers=len(provider_names) or 1) as executor:
+        return dict(zip(provider_names, executor.map(get_latest_provider_version, provider_names)))
+
+def provider_version_exists(provider_name: str, version: str) -> Optional[bool]:
+    """Check whether a provider version is published.  Returns None if the registry can't be reached."""
+    source = _provider_source(provider_name)
+    data = registry_lookup(source)
+    if data and data.get("versions"):
+        return version in data["versions"]
+
+    data = registry_lookup(f"{source}/{version}")
+    if data is None:
+        return None
+    return not data.get("not_found", False)
 
 from terraform_utils import get_latest_provider_version
-def create_terraform_config(provider: str, **kwargs) -> None:
+def create_terraform_config(provider: str, output_dir: str = ".", **kwargs) -> None:
     """Generate the Terraform configuration file for the specified provider."""
-    google_version = get_latest_provider_version("google")
-    okta_version = get_latest_provider_version("okta")
+    versions = resolve_provider_versions(["google", "okta"])
+    google_version = versions["google"]
+    okta_version = versions["okta"]
 
     terraform_block = f"""terraform {{
   required_providers {{
@@ -47,11 +153,11 @@ def create_terraform_config(provider: str, **kwargs) -> None:
   }}
 }}
 """
-    with open("main.tf", "w") as f:
+    with open(os.path.join(output_dir, "main.tf"), "w") as f:
         f.write(terraform_block)
-    create_provider_block(provider, **kwargs)
+    create_provider_block(provider, output_dir=output_dir, **kwargs)
 
-def create_provider_block(provider: str, **kwargs) -> None:
+def create_provider_block(provider: str, output_dir: str = ".", **kwargs) -> None:
     """Generates the provider block"""
     if provider.lower() == "gcp":
         config = f"""provider "google" {{
@@ -71,103 +177,337 @@ def create_provider_block(provider: str, **kwargs) -> None:
     else:
         raise ValueError(f"Unsupported provider: {provider}")
 
-    with open("main.tf", "a") as f:
+    config_file = os.path.join(output_dir, "main.tf")
+    with open(config_file, "a") as f:
         f.write(config)
 
-    print("\nTerraform configuration created successfully: main.tf")
+    print(f"\nTerraform configuration created successfully: {config_file}")
 
-def create_terraform_import_script(data: List[Dict], resource_type: str) -> Optional[str]:
-    """Generate a Terraform import script for Okta resources."""
-    temp_output_file = f"terraform_import_{resource_type}.tf"
+SUPPORTED_IMPORT_TYPES = tuple(PROJECTIONS) + tuple(DEPENDENT_RECORDS)
 
-    try:
-        with open(temp_output_file, 'w') as file:
-            for item in data:
-                if resource_type == 'groups':
-                    try:
-                        name = item['profile']['name']
-                        id_ = item['id']
-                        resource_address = f"okta_group.{sanitize_name(name)}"
-                    except KeyError as e:
-                        print(f"Skipping group with missing 'profile.name' or 'id': {e}")
-                        continue  # Skip to the next item if there's a KeyError
-                elif resource_type == 'users':
-                    try:
-                        name = f"{item['profile']['firstName']}_{item['profile']['lastName']}"
-                        id_ = item['id']
-                        resource_address = f"okta_user.{sanitize_name(name)}"
-                    except KeyError as e:
-                        print(f"Skipping user with missing 'profile.firstName', 'profile.lastName' or 'id': {e}")
-                        continue  # Skip to the next item if there's a KeyError
-                else:
-                    print(f"Unsupported resource type: {resource_type}")
-                    return None
-
-                import_block = f"""import {{
-  to = {resource_address}
-  id = "{id_}"
+_IMPORT_TO = re.compile(r'to\s*=\s*([\w-]+\.[\w-]+)')
+_IMPORT_ID = re.compile(r'id\s*=\s*"([^"]*)"')
+
+STATE_HOLDER = "terraform.tfstate"
+
+class AddressAllocator:
+    """Allocate unique, deterministic resource addresses across every import file in a run.
+
+    The same (type, import id) always gets the same address, and a name that is
+    already taken gets the next free `_1`, `_2`, ... suffix.  Suffixes are
+    first handed out in arrival order; settle() then reassigns a file's new
+    addresses in (name, import id) order, so they do not depend on how the
+    crawl was ordered.  Lookups are dictionary operations, so allocation stays
+    linear in the number of blocks.
+    Each resource is also held by one import file (or by state), so a file can
+    be rewritten with the same addresses while other files' resources are skipped.
+    """
+
+    def __init__(self):
+        self._by_import_id: Dict[Tuple[str, str], str] = {}
+        self._holders: Dict[Tuple[str, str], str] = {}
+        self._taken = set()
+        self._next_suffix: Dict[str, int] = {}
+        # Base address of each allocation not yet settled.
+        self._unsettled: Dict[Tuple[str, str], str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._taken)
+
+    def reserve(self, address: str, import_id: Optional[str] = None, holder: Optional[str] = None) -> None:
+        """Mark an address as used, e.g. because it is already in state or an earlier import file."""
+        with self._lock:
+            self._taken.add(address)
+            if import_id is not None:
+                key = (address.split('.', 1)[0], import_id)
+                self._by_import_id.setdefault(key, address)
+                if holder is not None:
+                    self._holders.setdefault(key, holder)
+
+    def address_of(self, terraform_type: str, import_id: str) -> Optional[str]:
+        """Return the address already allocated to a resource, if any."""
+        return self._by_import_id.get((terraform_type, import_id))
+
+    def claim(self, terraform_type: str, import_id: str, holder: str) -> bool:
+        """Record that an import file holds a resource.  Returns False if state or another file already does."""
+        with self._lock:
+            return self._holders.setdefault((terraform_type, import_id), holder) == holder
+
+    def allocate(self, terraform_type: str, name: str, import_id: str) -> str:
+        """Return the address for a resource, allocating a unique one on first sight."""
+        key = (terraform_type, import_id)
+        with self._lock:
+            address = self._by_import_id.get(key)
+            if address is not None:
+                return address
+
+            base = f"{terraform_type}.{sanitize_name(name)}"
+            address = self._take(base)
+            self._by_import_id[key] = address
+            self._unsettled[key] = base
+            return address
+
+    def settle(self, keys: Iterable[Tuple[str, str]]) -> None:
+        """Reassign the addresses allocated to these (type, import id) keys in (name, import id) order.
+
+        The same resources then get the same addresses, suffixes included,
+        whatever order they arrived in.  Addresses reserved from state or
+        earlier import files are kept.
+        """
+        with self._lock:
+            pending = sorted((self._unsettled.pop(key), key[1], key) for key in keys if key in self._unsettled)
+            for base, _, key in pending:
+                self._taken.discard(self._by_import_id[key])
+                self._next_suffix.pop(base, None)
+            for base, _, key in pending:
+                self._by_import_id[key] = self._take(base)
+
+    def _take(self, base: str) -> str:
+        """Take the first free address for a base name.  Called with the lock held."""
+        address = base
+        if address in self._taken:
+            suffix = self._next_suffix.get(base, 1)
+            while f"{base}_{suffix}" in self._taken:
+                suffix += 1
+            address = f"{base}_{suffix}"
+            self._next_suffix[base] = suffix + 1
+        self._taken.add(address)
+        return address
+
+    def reserve_from_import_files(self, pattern: str = "output_file_*.tf") -> int:
+        """Reserve the addresses of import blocks in existing files.  Returns the number reserved."""
+        count = 0
+        for file_path in sorted(glob.glob(pattern)):
+            address = None
+            try:
+                with open(file_path, "r") as file:
+                    for line in file:
+                        to_match = _IMPORT_TO.search(line)
+                        if to_match:
+                            address = to_match.group(1)
+                            continue
+                        id_match = _IMPORT_ID.search(line)
+                        if id_match and address:
+                            self.reserve(address, id_match.group(1), os.path.basename(file_path))
+                            address = None
+                            count += 1
+            except IOError as e:
+                print(f"Could not read {file_path}: {e}")
+        return count
+
+    def reserve_from_state(self, state: StateIndex) -> int:
+        """Reserve the addresses of every resource managed in state.  Returns the number reserved."""
+        count = 0
+        for _, resource_id, address in state.items():
+            self.reserve(address, resource_id, STATE_HOLDER)
+            count += 1
+        return count
+
+_run_allocators: Dict[str, AddressAllocator] = {}
+# One lock per directory, so seeding one directory's allocator does not hold up the others.
+_run_allocator_locks: Dict[str, threading.Lock] = {}
+_run_allocator_locks_lock = threading.Lock()
+
+def get_address_allocator(output_dir: str = ".") -> AddressAllocator:
+    """Return the allocator shared by every import file written to a directory in this run.
+
+    It is seeded on first use with the addresses in state (the same index the
+    writers filter with, so remote state counts too) and existing import
+    files, so new blocks never collide with them and rewritten files keep
+    their addresses.
+    """
+    key = os.path.abspath(output_dir)
+    with _run_allocator_locks_lock:
+        lock = _run_allocator_locks.setdefault(key, threading.Lock())
+    with lock:
+        allocator = _run_allocators.get(key)
+        if allocator is None:
+            allocator = AddressAllocator()
+            # State first: a resource that is already managed is never imported again.
+            allocator.reserve_from_state(get_state_index(output_dir))
+            allocator.reserve_from_import_files(os.path.join(output_dir, "output_file_*.tf"))
+            _run_allocators[key] = allocator
+    return allocator
+
+def import_file_name(resource_type: str) -> str:
+    """Return the import file for a resource type.  The name is fixed, so each run replaces the last one's file."""
+    return f"output_file_{resource_type}.tf"
+
+def build_import_block(record: ResourceRecord, allocator: Optional[AddressAllocator] = None,
+                       holder: Optional[str] = None) -> Optional[str]:
+    """Build the import block for one resource record.  Returns None if the resource is already imported.
+
+    Records that are in state, or held by an import file other than `holder`,
+    are skipped, so no resource is imported twice.  Without a holder, any
+    record that already has an address is skipped.
+    """
+    if allocator is None:
+        allocator = get_address_allocator()
+    existing = allocator.address_of(record.terraform_type, record.import_id)
+    if existing and (holder is None or not allocator.claim(record.terraform_type, record.import_id, holder)):
+        print(f"Skipping {record.name} (ID: {record.import_id}): already imported as {existing}")
+        return None
+    if holder is not None:
+        allocator.claim(record.terraform_type, record.import_id, holder)
+    return _import_block(allocator.allocate(record.terraform_type, record.name, record.import_id), record.import_id)
+
+def _import_block(address: str, import_id: str) -> str:
+    return f"""import {{
+  to = {address}
+  id = "{import_id}"
 }}
 """
-                file.write(import_block)
-                print(f"Added import block for {name} (ID: {id_})")
 
-        final_output_file = f"output_file_{random.randint(1000, 9999)}_{resource_type}.tf"
+class ImportScriptWriter:
+    """Write import blocks for one resource type as records arrive, without holding them in memory.
+
+    Records already managed in the directory's Terraform state are dropped
+    before any block is built; see terraform_state.get_state_index.  Only
+    each resource's type and import ID are kept in memory.  close() settles
+    the addresses of colliding names (see AddressAllocator.settle), writes the
+    import blocks sorted by address and moves the result over
+    output_file_{type}.tf in one atomic replace, so a rerun over the same
+    resources reproduces the same file byte for byte however the crawl ordered
+    them.  Where the record holds enough to render it (see terraform_hcl), the
+    resource block goes to a hidden temporary file as it arrives and is
+    published the same way, to generated_{type}.tf.
+    """
 
+    def __init__(self, resource_type: str, verbose: bool = True, allocator: Optional[AddressAllocator] = None,
+                 output_dir: str = ".", state: Optional[StateIndex] = None):
+        if resource_type not in SUPPORTED_IMPORT_TYPES:
+            raise ValueError(f"Unsupported resource type: {resource_type}")
+        self.resource_type = resource_type
+        self.verbose = verbose
+        self.output_dir = output_dir
+        self.allocator = allocator if allocator is not None else get_address_allocator(output_dir)
+        self.state = state if state is not None else get_state_index(output_dir)
+        self.count = 0
+        self.managed = 0
+        self.synthesized = 0
+        self.output_file = os.path.join(output_dir, import_file_name(resource_type))
+        self.holder = import_file_name(resource_type)
+        self.config_file = os.path.join(output_dir, synthesized_config_file(resource_type))
+        # Not .tf files, so Terraform never reads a half-written script.
+        self.temp_output_file = os.path.join(output_dir, f".{import_file_name(resource_type)}.tmp")
+        self.temp_config_file = os.path.join(output_dir, f".{synthesized_config_file(resource_type)}.tmp")
+        self._written = set()
+        # ((type, import id), (offset, length) in the config temp file or None)
+        self._spans: List[Tuple[Tuple[str, str], Optional[Tuple[int, int]]]] = []
+        self.config = open(self.temp_config_file, 'wb')
+
+    def write(self, item: Union[ResourceRecord, Dict]) -> bool:
+        """Append the import block for one record (or raw API object).  Returns False if it was skipped."""
+        record = item if isinstance(item, ResourceRecord) else project_record(item, self.resource_type)
+        if record is None:
+            return False
+        if self.state.address_of(record.terraform_type, record.import_id):
+            self.managed += 1
+            return False
+        key = (record.terraform_type, record.import_id)
+        if key in self._written:
+            return False
+        if build_import_block(record, self.allocator, self.holder) is None:
+            return False
+        self._written.add(key)
+        self.count += 1
+        address = self.allocator.address_of(record.terraform_type, record.import_id)
+        resource_block = render_resource(record, address)
+        config_span = None
+        if resource_block is not None:
+            config_span = _append(self.config, resource_block)
+            self.synthesized += 1
+        self._spans.append((key, config_span))
+        if self.verbose:
+            print(f"Added import block for {record.name} (ID: {record.import_id})")
+        return True
+
+    def close(self) -> Optional[str]:
+        """Close the script and move it over output_file_{type}.tf.  Returns None if it could not be moved."""
+        self.config.close()
+        self.allocator.settle(key for key, _ in self._spans)
+        blocks = sorted((self.allocator.address_of(*key), key[1], config_span) for key, config_span in self._spans)
         try:
-            os.rename(temp_output_file, final_output_file)
-            print(f"\nTerraform import script created and renamed to: {final_output_file}")
+            with open(self.temp_output_file, 'w') as file:
+                for address, import_id, _ in blocks:
+                    file.write(_import_block(address, import_id))
+            os.replace(self.temp_output_file, self.output_file)
+            if self.synthesized:
+                _publish_config(self.temp_config_file, self.config_file,
+                                [(address, span) for address, _, span in blocks if span is not None])
+            else:
+                # A config left from an earlier run would declare resources that have no import block now.
+                for path in (self.temp_config_file, self.config_file):
+                    if os.path.exists(path):
+                        os.remove(path)
         except OSError as e:
             print(f"Error renaming file: {e}")
-            final_output_file = temp_output_file
+            return None
+        print(f"\nTerraform import script written to: {self.output_file}")
+        if self.synthesized:
+            print(f"Configuration for {self.synthesized} of {self.count} {self.resource_type} written to {self.config_file}")
+        if self.managed:
+            print(f"{self.resource_type}: {self.managed} already managed in state, {self.count} to import")
+        record_state_filter(self.resource_type, self.managed, self.count)
+        return self.output_file
+
+    def discard(self) -> None:
+        """Drop the script and keep the previous output_file_{type}.tf.  Does nothing after close()."""
+        self.config.close()
+        for path in (self.temp_output_file, self.temp_config_file, f"{self.temp_config_file}.sorted"):
+            if os.path.exists(path):
+                os.remove(path)
+
+def _append(file, text: str) -> Tuple[int, int]:
+    """Write text to a binary file.  Returns its (offset, length)."""
+    data = text.encode()
+    offset = file.tell()
+    file.write(data)
+    return offset, len(data)
 
-        return final_output_file
+def _publish_config(temp_path: str, path: str, blocks: List[Tuple[str, Tuple[int, int]]]) -> None:
+    """Copy resource blocks from a temporary file, in order, to `path` atomically, then remove the temporary file.
 
+    Each block is given as (address, (offset, length)); its `resource` line
+    is rewritten for the address, which settling may have changed since the
+    block was rendered.
+    """
+    with open(temp_path, 'rb') as source, open(f"{temp_path}.sorted", 'wb') as target:
+        for i, (address, (offset, length)) in enumerate(blocks):
+            if i:
+                target.write(b"\n")
+            source.seek(offset)
+            terraform_type, name = address.split(".", 1)
+            target.write(f'resource "{terraform_type}" "{name}" {{\n'.encode())
+            target.write(source.read(length).split(b"\n", 1)[1])
+    os.replace(f"{temp_path}.sorted", path)
+    os.remove(temp_path)
+
+def create_terraform_import_script(data: Iterable[Union[ResourceRecord, Dict]], resource_type: str, verbose: bool = True,
+                                   allocator: Optional[AddressAllocator] = None, output_dir: str = ".",
+                                   state: Optional[StateIndex] = None) -> Optional[str]:
+    """Generate a Terraform import script for Okta and GCP resources, leaving out those already in state."""
+    try:
+        writer = ImportScriptWriter(resource_type, verbose=verbose, allocator=allocator, output_dir=output_dir,
+                                    state=state)
+    except ValueError as e:
+        print(e)
+        return None
     except IOError as e:
         print(f"Error creating Terraform import script: {e}")
         return None
 
-def handle_duplicate_imports(file_path: str) -> None:
-    """Handle duplicate Terraform imports by renaming them and displaying changes."""
     try:
-        # Read the file content
-        with open(file_path, "r") as file:
-            lines = file.readlines()
-
-        # Variables to track duplicates and modifications
-        resource_count = {}
-        modified_lines = []
-        renamed_resources = {}  # Dictionary to track renamed resources
-
-        # Process each line
-        for line in lines:
-            match = re.search(r'to\s*=\s*(\w+\.\w+)', line)
-            if match:
-                resource_name = match.group(1)
-                if resource_name in resource_count:
-                    # Increment duplicate count and modify resource name
-                    resource_count[resource_name] += 1
-                    new_resource_name = f"{resource_name}_{resource_count[resource_name]}"
-                    renamed_resources[resource_name] = new_resource_name
-                    line = line.replace(resource_name, new_resource_name)
-                else:
-                    # First occurrence of the resource
-                    resource_count[resource_name] = 0
-            modified_lines.append(line)
-
-        # Write the modified content back to the file
-        with open(file_path, "w") as file:
-            file.writelines(modified_lines)
-
-        # Display renamed resources
-        if renamed_resources:
-            print(f"\nDuplicate resources found and renamed in {file_path}:")
-            for original, renamed in renamed_resources.items():
-                print(f"  - {original} -> {renamed}")
-        else:
-            print(f"\nNo duplicates found in {file_path}.")
-
+        with phase("write"):
+            for item in data:
+                writer.write(item)
+            return writer.close()
     except IOError as e:
-        print(f"Error handling duplicate imports in {file_path}: {e}")
+        print(f"Error creating Terraform import script: {e}")
+        return None
+    finally:
+        writer.discard()
 
 #Copyright (c) 2025 Stephen Agius
 #Licensed under the GNU General Public License, version 3.
\ No newline at end of file
@@ -1,6 +1,10 @@
 import re
-import subprocess
+import hashlib
+import threading
 import os
+from typing import Iterator, Optional
+from metrics import phase
+from terraform_runner import run_terraform
 
 def sanitize_name(name: str) -> str:
     """Sanitize a string to be a valid Terraform resource name."""
@@ -9,26 +13,109 @@ def sanitize_name(name: str) -> str:
         sanitized = f"r_{sanitized}"
     return sanitized if sanitized else "default_resource"  # Ensure a non-empty string is always returned
 
-def check_terraform_init() -> bool:
-    """Check if Terraform is initialized and initialize or upgrade as needed.  Returns True if successful, False otherwise."""
+def get_cache_dir(*parts: str) -> str:
+    """Return (and create) a directory under the user's terraform-importer cache."""
+    base = os.environ.get('TERRAFORM_IMPORTER_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+        'terraform-importer'
+    )
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def is_offline() -> bool:
+    """True when TERRAFORM_IMPORTER_OFFLINE is set, e.g. for air-gapped runs."""
+    return os.environ.get('TERRAFORM_IMPORTER_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+INIT_FINGERPRINT_FILE = 'terraform-importer.fingerprint'
+
+_init_lock = threading.Lock()
+
+def ensure_plugin_cache() -> str:
+    """Point Terraform at a shared provider plugin cache so runs and workers reuse one download."""
+    cache_dir = os.environ.get('TF_PLUGIN_CACHE_DIR') or get_cache_dir('plugin-cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ['TF_PLUGIN_CACHE_DIR'] = cache_dir
+    return cache_dir
+
+def _terraform_blocks(text: str) -> Iterator[str]:
+    """Yield the top-level `terraform { ... }` blocks of a configuration file."""
+    for match in re.finditer(r'^terraform\s*\{', text, re.MULTILINE):
+        depth = 0
+        for index in range(match.end() - 1, len(text)):
+            if text[index] == '{':
+                depth += 1
+            elif text[index] == '}':
+                depth -= 1
+                if depth == 0:
+                    yield text[match.start():index + 1]
+                    break
+
+def init_fingerprint(work_dir: str = '.') -> str:
+    """Hash what terraform init depends on: required providers and versions, provider names, the lockfile and the plugin cache.
+
+    Import files and generated configuration are skipped, as for plan shards;
+    they can be tens of MB and never change what init installs.
+    """
+    # terraform_plan imports this module, so it is imported here rather than at the top.
+    from terraform_plan import shared_config_files
+
+    digest = hashlib.sha256()
+    for file_path in shared_config_files(work_dir):
+        with open(file_path, 'r') as f:
+            text = f.read()
+        for block in _terraform_blocks(text):
+            digest.update(block.encode())
+        # Providers used without a required_providers entry still need installing.
+        for provider in sorted(set(re.findall(r'^provider\s+"([^"]+)"', text, re.MULTILINE))):
+            digest.update(provider.encode())
+    lock_file = os.path.join(work_dir, '.terraform.lock.hcl')
+    if os.path.exists(lock_file):
+        with open(lock_file, 'rb') as f:
+            digest.update(f.read())
+    digest.update(os.environ.get('TF_PLUGIN_CACHE_DIR', '').encode())
+    return digest.hexdigest()
+
+def _stored_fingerprint(work_dir: str) -> Optional[str]:
     try:
-        if os.path.exists('.terraform'):
-            print("Terraform already initialised. Upgrading...")
-            result = subprocess.run(["terraform", "init", "-upgrade"], capture_output=True, text=True, check=True)
-            print(result.stdout)
-            print("Terraform upgraded successfully.")
-        else:
-            print("Initialising Terraform...")
-            result = subprocess.run(["terraform", "init"], capture_output=True, text=True, check=True)
-            print(result.stdout)
+        with open(os.path.join(work_dir, '.terraform', INIT_FINGERPRINT_FILE), 'r') as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+def check_terraform_init(work_dir: str = '.', force: bool = False) -> bool:
+    """Check if Terraform is initialized and initialize or upgrade as needed.  Returns True if successful, False otherwise.
+
+    Init is skipped when the required providers, versions and lockfile are
+    unchanged since the last successful init in this directory.
+    """
+    ensure_plugin_cache()
+    terraform_dir = os.path.join(work_dir, '.terraform')
+    # Terraform's plugin cache is not safe for concurrent installs, so inits in this process take turns.
+    with _init_lock, phase("init"):
+        try:
+            if os.path.exists(terraform_dir) and not force and _stored_fingerprint(work_dir) == init_fingerprint(work_dir):
+                print("Terraform already initialised and providers are unchanged. Skipping init.")
+                return True
+            # Init's output is printed as it arrives; provider downloads can take a while.
+            if os.path.exists(terraform_dir):
+                print("Terraform already initialised. Upgrading...")
+                run = run_terraform(["terraform", "init", "-upgrade", "-input=false"], cwd=work_dir, echo=True)
+            else:
+                print("Initialising Terraform...")
+                run = run_terraform(["terraform", "init", "-input=false"], cwd=work_dir, echo=True)
+            if not run.ok:
+                print("Error during Terraform initialisation/upgrade (see the output above).")
+                return False
             print("Terraform initialised successfully.")
+        except FileNotFoundError:
+            print("Error: Terraform is not installed or not in your PATH.")
+            return False
+
+        # Fingerprint after init, so the lockfile it may have written is included.
+        with open(os.path.join(terraform_dir, INIT_FINGERPRINT_FILE), 'w') as f:
+            f.write(init_fingerprint(work_dir))
         return True
-    except subprocess.CalledProcessError as e:
-        print(f"Error during Terraform initialisation/upgrade: {e.stderr}")
-        return False
-    except FileNotFoundError:
-        print("Error: Terraform is not installed or not in your PATH.")
-        return False
 
 
 